@@ -0,0 +1,120 @@
+"""
+login/ 加解密基础操作的微基准测试，结果写入 JSON 文件，可与上次结果对比检查性能回退
+
+python -m benchmark.crypto --output crypto.json
+python -m benchmark.crypto --compare crypto.json --threshold 0.2
+"""
+import sys
+import json
+import timeit
+import hashlib
+import argparse
+import platform
+
+from login import des_3
+from login import rsa_encrypt as rsa
+
+APP_KEY = 'ABCDEFGHIJKLMNOPQRSTUVWX'
+PASSWORD = 'password1234'
+
+
+def login_args(password_list):
+    return {
+        'appCode': 'M002',
+        'deviceId': '1234567890123456',
+        'netWork': 'wifi',
+        'password': password_list,
+        'qudao': 'guanwang',
+        'requestMethod': 'cam_iface46/loginnew.action',
+        'shebeixinghao': 'MLA-AL10',
+        'systemType': 'android',
+        'telephoneInfo': '5.1.1',
+        'telephoneModel': 'HUAWEI MLA-AL10',
+        'type': '1',
+        'userName': '13800000000',
+        'wanxiaoVersion': 10462101,
+        'yunyingshang': '07'
+    }
+
+
+def cases():
+    '''
+    :return: [(名称, 被测函数, 每轮次数), ...]
+    '''
+    public_key, private_key = rsa.create_key_pair(1024)
+    session_info = rsa.rsa_encrypt(json.dumps({'session': 'a' * 32, 'key': 'b' * 32}), public_key)
+    args = login_args(des_3.des_3_encrypt_many(list(PASSWORD), APP_KEY, '66666666'))
+    encrypted_args = des_3.object_encrypt(args, APP_KEY)
+    upload_args = {'session': 'a' * 32, 'data': encrypted_args}
+
+    def rsa_decrypt_cold():
+        rsa._key_cache.pop(private_key, None)
+        rsa.rsa_decrypt(session_info, private_key)
+
+    def des_per_password_cold():
+        des_3.get_cipher.cache_clear()
+        des_3.des_3_encrypt_many(list(PASSWORD), APP_KEY, '66666666')
+
+    return [
+        ('rsa_create_key_pair_1024', lambda: rsa.create_key_pair(1024), 3),
+        ('rsa_encrypt', lambda: rsa.rsa_encrypt('x' * 64, public_key), 200),
+        ('rsa_decrypt', lambda: rsa.rsa_decrypt(session_info, private_key), 200),
+        ('rsa_decrypt_cold_key', rsa_decrypt_cold, 100),
+        ('des_3_encrypt_char', lambda: des_3.des_3_encrypt('p', APP_KEY, '66666666'), 5000),
+        ('des_3_encrypt_password', lambda: des_3.des_3_encrypt_many(list(PASSWORD), APP_KEY, '66666666'), 5000),
+        ('des_3_encrypt_password_cold', des_per_password_cold, 2000),
+        ('object_encrypt_login_args', lambda: des_3.object_encrypt(args, APP_KEY), 2000),
+        ('object_decrypt_login_args', lambda: des_3.object_decrypt(encrypted_args, APP_KEY), 2000),
+        ('campus_sign_sha256', lambda: hashlib.sha256(json.dumps(upload_args).encode('utf-8')).hexdigest(), 5000),
+    ]
+
+
+def run(repeat=5):
+    '''
+    每个用例跑 repeat 轮，取最快一轮的单次耗时（微秒）
+    '''
+    results = {}
+    for name, func, number in cases():
+        results[name] = min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    :return: 慢于基准超过 threshold 比例的用例 [(名称, 基准, 当前), ...]
+    '''
+    return [
+        (name, baseline[name], value)
+        for name, value in results.items()
+        if name in baseline and value > baseline[name] * (1 + threshold)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='login/ 加解密微基准测试')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='将结果写入 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的最大变慢比例，默认 0.2')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    for name, value in results.items():
+        print(f'{name:<32}{value:>12.1f} us')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results},
+                      f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f'性能回退：{name} {old:.1f} us -> {new:.1f} us（+{(new / old - 1) * 100:.0f}%）')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+本地模拟的完美校园服务器，实现项目用到的所有接口（含真实的 RSA / 3DES 登录协议），用于压测，不访问真实服务
+
+python -m benchmark.fake_server --port 8000 --accounts 100
+"""
+import json
+import time
+import random
+import string
+import hashlib
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from login import des_3
+from login import rsa_encrypt as rsa
+
+# 项目访问的所有域名，压测时全部转发到模拟服务器
+HOSTS = (
+    'app.17wanxiao.com',
+    'reportedh5.17wanxiao.com',
+    'server.59wanmei.com',
+    'sc.ftqq.com',
+)
+
+AREA_STR = json.dumps({
+    'streetNumber': '', 'street': '', 'district': '', 'city': '长沙市', 'province': '湖南省',
+    'town': '', 'pois': '', 'lng': 112.99, 'lat': 28.13, 'address': '湖南省长沙市', 'text': '湖南省-长沙市', 'code': '',
+}, ensure_ascii=False)
+
+TEMPLATE = [
+    {'propertyname': 'temperature', 'decription': '体温', 'checkValues': [], 'value': '36.5'},
+    {'propertyname': 'symptom', 'decription': '症状', 'checkValues': [{'text': '无症状'}], 'value': '无症状'},
+    {'propertyname': 'isTouch', 'decription': '是否接触', 'checkValues': [{'text': '否'}], 'value': '否'},
+]
+
+RECALL_FIELDS = (
+    'whereabouts', 'beenToWuhan', 'contactWithPatients', 'symptom', 'fever', 'cough', 'soreThroat',
+    'debilitation', 'diarrhea', 'cold', 'staySchool', 'contacts', 'emergencyPhone', 'address', 'collegeId',
+    'majorId', 'classId', 'classDescribe', 'temperature', 'confirmed', 'isolated', 'passingWuhan',
+    'passingHubei', 'patientSide', 'patientContact', 'mentalHealth', 'wayToSchool', 'backToSchool',
+    'haveBroadband', 'emergencyContactName',
+)
+
+
+def synthetic_accounts(count):
+    '''
+    :return: [(手机号, 密码), ...]
+    '''
+    return [(f'138{i:08d}', f'pw{i:06d}') for i in range(count)]
+
+
+class FakeWanxiao:
+    '''
+    模拟服务器的状态：账号、会话和注入的延迟 / 错误率
+    '''
+
+    def __init__(self, accounts, schools=10, recall_ratio=0.0, latency=0.0, error_rate=0.0, seed=None, capacity=0):
+        '''
+        :param accounts: [(手机号, 密码), ...]
+        :param schools: 学校数量，账号按顺序轮流分配
+        :param recall_ratio: 使用第二类健康打卡的学校比例
+        :param latency: 每个请求注入的延迟（秒），实际延迟在 [0.5, 1.5] 倍之间波动
+        :param error_rate: 随机返回 503 的概率
+        :param capacity: 同时处理的请求数上限，超过时返回 429，0 表示不限制
+        '''
+        self.passwords = dict(accounts)
+        self.users = {
+            phone: {'userId': 10000 + i, 'customerId': 100 + i % schools, 'stuNo': f'2020{i:06d}'}
+            for i, (phone, _) in enumerate(accounts)
+        }
+        self.recall_customers = {100 + i for i in range(schools) if i < schools * recall_ratio}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.in_flight = 0
+        self.rejected = 0
+        # 收到的 Server酱推送：[(sckey, desp), ...]
+        self.pushes = []
+        self.sessions = {}
+        self.tokens = {}
+        self.requests = 0
+        self.submits = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def user_of(self, token):
+        phone = self.tokens.get(token)
+        return phone, self.users.get(phone)
+
+    def exchange_secret(self, body):
+        public_key = json.loads(body)['key']
+        session_id = ''.join(self._random.choice(string.hexdigits) for _ in range(32))
+        app_key = ''.join(self._random.choice(string.ascii_letters) for _ in range(32))
+        with self._lock:
+            self.sessions[session_id] = app_key[:24]
+        return rsa.rsa_encrypt(json.dumps({'session': session_id, 'key': app_key}), public_key)
+
+    def login(self, body, campus_sign):
+        if hashlib.sha256(body).hexdigest() != campus_sign:
+            return {'result_': False, 'message_': 'campusSign 校验失败', 'code_': '1'}
+        upload_args = json.loads(body)
+        app_key = self.sessions.get(upload_args['session'])
+        if app_key is None:
+            return {'result_': False, 'message_': '会话不存在', 'code_': '1'}
+        login_args = des_3.object_decrypt(upload_args['data'], app_key)
+        phone = login_args['userName']
+        if phone not in self.passwords:
+            return {'result_': False, 'message_': '该手机号未注册完美校园', 'code_': '4'}
+        password = ''.join(des_3.des_3_decode(i, app_key, '66666666').decode('utf-8') for i in login_args['password'])
+        if password != self.passwords[phone]:
+            return {'result_': False, 'message_': '密码错误,您还有5次机会!', 'code_': '5'}
+        with self._lock:
+            self.tokens[upload_args['session']] = phone
+        return {'result_': True, 'data': '', 'message_': '登录成功', 'code_': '0'}
+
+    def user_info(self, form):
+        phone, user = self.user_of(form.get('token'))
+        if not user:
+            return {'result_': False, 'message_': 'token已失效'}
+        return {'userInfo': {
+            'classId': 1, 'classDescription': '计算机1班', 'customerId': user['customerId'],
+            'customerAppTypeId': user['customerId'] * 10, 'userId': user['userId'],
+            'username': f'学生{user["userId"]}', 'stuNo': user['stuNo'],
+        }}
+
+    def epmpics(self, body):
+        req = json.loads(body)
+        phone, user = self.user_of(req['jsonData'].get('token'))
+        if not user:
+            return {'code': '-10000', 'msg': 'token已失效'}
+        method = req['method']
+        if method in ('userComeApp', 'userComeAppSchool'):
+            if user['customerId'] in self.recall_customers:
+                return {'code': '-10000', 'msg': '未配置该模板'}
+            return {'code': '10000', 'data': json.dumps({
+                'areaStr': AREA_STR, 'phonenum': phone,
+                'templateid': req['jsonData']['templateid'], 'cusTemplateRelations': TEMPLATE,
+            }, ensure_ascii=False)}
+        with self._lock:
+            self.submits += 1
+        return {'code': '10000', 'msg': '成功', 'data': 'success'}
+
+    def recall(self, form):
+        phone, user = self.user_of(form.get('token'))
+        if not user:
+            return {'code': -1, 'msg': 'token已失效'}
+        data = {i: '' for i in RECALL_FIELDS}
+        data.update(userId=user['userId'], name=f'学生{user["userId"]}', stuNo=user['stuNo'], temperature='36.5')
+        return {'code': 0, 'data': data}
+
+    def receive(self, form):
+        phone, user = self.user_of(form.get('token'))
+        if not user:
+            return {'code': -1, 'msg': 'token已失效'}
+        with self._lock:
+            self.submits += 1
+        return {'code': 0, 'msg': '成功'}
+
+    def rules(self, form):
+        return {'customerAppTypeDto': {'ruleList': [
+            {'id': 1, 'templateid': 'clockSign1', 'startTime': '07:00', 'endTime': '09:00'},
+            {'id': 2, 'templateid': 'clockSign2', 'startTime': '12:00', 'endTime': '14:00'},
+            {'id': 3, 'templateid': 'clockSign3', 'startTime': '18:00', 'endTime': '21:00'},
+        ]}}
+
+    def child_apps(self, form):
+        return {'appList': [{'customerAppTypeRuleList': [{'id': 3}, {'id': 1}, {'id': 2}]}]}
+
+    def handle(self, path, headers, body):
+        '''
+        :return: (状态码, 响应内容)
+        '''
+        with self._lock:
+            self.requests += 1
+            if self.capacity and self.in_flight >= self.capacity:
+                self.rejected += 1
+                return 429, 'Too Many Requests'
+            self.in_flight += 1
+            fail = self._random.random() < self.error_rate
+            delay = self.latency * self._random.uniform(0.5, 1.5)
+        try:
+            if delay:
+                time.sleep(delay)
+            if fail:
+                return 503, 'Service Unavailable'
+            return self.route(path, headers, body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def route(self, path, headers, body):
+        form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()} \
+            if 'json' not in headers.get('Content-Type', '') else {}
+        if path.endswith('exchangeSecretkey.action'):
+            return 200, self.exchange_secret(body)
+        if path.endswith('loginnew.action'):
+            return 200, self.login(body, headers.get('campusSign'))
+        if path == '/api/clock/school/getUserInfo':
+            return 200, self.user_info(form)
+        if path == '/sass/api/epmpics':
+            return 200, self.epmpics(body)
+        if path == '/api/reported/recall':
+            return 200, self.recall(form)
+        if path == '/api/reported/receive':
+            return 200, self.receive(form)
+        if path == '/api/clock/school/rules':
+            return 200, self.rules(form)
+        if path == '/api/clock/school/childApps':
+            return 200, self.child_apps(form)
+        if path == '/YKT_Interface/xyk':
+            return 200, {'data': {'customerName': '模拟大学'}}
+        if path.endswith('.send'):
+            with self._lock:
+                self.pushes.append((path.rsplit('/', 1)[-1][:-len('.send')], form.get('desp', '')))
+            return 200, {'errno': 0, 'errmsg': 'success'}
+        return 404, 'Not Found'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, content = self.server.fake.handle(self.path.split('?')[0], self.headers, body)
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        content = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(fake, host='127.0.0.1', port=0):
+    '''
+    在后台线程中启动模拟服务器
+    :return: (server, 服务地址)
+    '''
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name='fake-wanxiao', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的完美校园服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--schools', type=int, default=10)
+    parser.add_argument('--recall-ratio', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0, help='注入延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, default=0, help='同时处理的请求数上限，超过时返回 429')
+    args = parser.parse_args()
+    fake = FakeWanxiao(
+        synthetic_accounts(args.accounts), args.schools, args.recall_ratio, args.latency / 1000, args.error_rate,
+        capacity=args.capacity,
+    )
+    server, url = start(fake, args.host, args.port)
+    print(f'模拟服务器已启动：{url}，账号 138xxxxxxxx / pwxxxxxx')
+    print('HTTP_HOST_OVERRIDE=' + ','.join(f'{i}={url}' for i in HOSTS))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+本地模拟的 SMTP 服务器（明文，支持 AUTH LOGIN / PLAIN），记录收到的邮件，用于测试推送，不发送真实邮件
+
+python -m benchmark.fake_smtp --port 2525
+SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_SSL=0
+"""
+import time
+import argparse
+import threading
+import socketserver
+
+
+class FakeSmtp:
+    '''
+    模拟服务器的状态
+    '''
+
+    def __init__(self, handshake=0.0, drop_after=0):
+        '''
+        :param handshake: 每次建立连接和登录的延迟（秒），模拟 TLS 握手和认证
+        :param drop_after: 每个连接发送这么多封邮件后由服务器断开，0 表示不断开，用于测试重连
+        '''
+        self.handshake = handshake
+        self.drop_after = drop_after
+        self.connections = 0
+        self.logins = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('utf-8'))
+
+    def handle(self):
+        fake = self.server.fake
+        with fake._lock:
+            fake.connections += 1
+        time.sleep(fake.handshake / 2)
+        self.reply('220 fake-smtp ready')
+        sent = 0
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-fake-smtp\r\n250-AUTH LOGIN PLAIN\r\n250 8BITMIME\r\n')
+            elif verb == 'AUTH':
+                parts = command.split()
+                if parts[1].upper() == 'LOGIN':
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                elif len(parts) < 3:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                time.sleep(fake.handshake / 2)
+                with fake._lock:
+                    fake.logins += 1
+                self.reply('235 Authentication successful')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip('<>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b'.\r\n':
+                        break
+                    data.append(chunk)
+                with fake._lock:
+                    fake.messages.append((sender, recipients, b''.join(data)))
+                self.reply('250 OK queued')
+                sent += 1
+                if fake.drop_after and sent >= fake.drop_after:
+                    return
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start(fake, host='127.0.0.1', port=0):
+    '''
+    在后台线程中启动模拟 SMTP 服务器
+    :return: (server, 端口)
+    '''
+    server = Server((host, port), Handler)
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name='fake-smtp', daemon=True).start()
+    return server, server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的 SMTP 服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    args = parser.parse_args()
+    fake = FakeSmtp()
+    server, port = start(fake, args.host, args.port)
+    print(f'模拟 SMTP 服务器已启动：{args.host}:{port}')
+    print(f'SMTP_HOST={args.host} SMTP_PORT={port} SMTP_SSL=0')
+    try:
+        while True:
+            time.sleep(5)
+            print(f'连接 {fake.connections}，登录 {fake.logins}，邮件 {len(fake.messages)}')
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+端到端压测：启动本地模拟服务器，用 N 个虚拟账号跑 main_handler / check_in，
+输出吞吐量（账号/秒）、单账号耗时 p50/p99 以及每个阶段的 CPU 时间
+
+python -m benchmark.load --accounts 200 --latency 50 --error-rate 0.01 --concurrency 8
+python -m benchmark.load --accounts 200 --latency 50 --concurrency 16 --capacity 6
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import functools
+import threading
+
+import index
+from benchmark import fake_server
+from utils import http_client, rate_limit
+from utils.accounts import Account
+
+# (阶段名称, index 中对应的函数)
+PHASES = (
+    ('login', 'login_user'),
+    ('user_info', 'get_user_info'),
+    ('template', 'get_post_json'),
+    ('template', 'get_recall_data'),
+    ('submit', 'healthy_check_in'),
+    ('submit', 'receive_check_in'),
+    ('push', 'server_push'),
+)
+
+
+class Recorder:
+    '''
+    记录每个阶段的调用次数、耗时、CPU 时间，以及每个账号从登录到提交完成的耗时
+    '''
+
+    def __init__(self):
+        self.phases = {}
+        self.started = {}
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def wrap(self, phase, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+                with self._lock:
+                    stat = self.phases.setdefault(phase, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+                    stat['calls'] += 1
+                    stat['wall'] += wall
+                    stat['cpu'] += cpu
+        return wrapper
+
+    def wrap_account(self, start_func, end_func):
+        @functools.wraps(start_func)
+        def start(username, *args, **kwargs):
+            self.started.setdefault(username, time.perf_counter())
+            return start_func(username, *args, **kwargs)
+
+        @functools.wraps(end_func)
+        def end(username, *args, **kwargs):
+            try:
+                return end_func(username, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self.latencies.append(time.perf_counter() - self.started[username])
+        return start, end
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def instrument(recorder):
+    for phase, name in PHASES:
+        setattr(index, name, recorder.wrap(phase, getattr(index, name)))
+    index.login_user, index.submit_check_in = recorder.wrap_account(index.login_user, index.submit_check_in)
+
+
+def run(args):
+    accounts = fake_server.synthetic_accounts(args.accounts)
+    fake = fake_server.FakeWanxiao(
+        accounts, args.schools, args.recall_ratio, args.latency / 1000, args.error_rate, seed=args.seed,
+        capacity=args.capacity,
+    )
+    server, url = fake_server.start(fake)
+    http_client.override_hosts({host: url for host in fake_server.HOSTS})
+    recorder = Recorder()
+    instrument(recorder)
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    if args.mode == 'main':
+        os.environ.update(
+            USERNAME=','.join(i[0] for i in accounts),
+            PASSWORD=','.join(i[1] for i in accounts),
+            SCKEY='SCUbenchmark',
+            CONCURRENCY=str(args.concurrency),
+        )
+        index.main_handler()
+    elif args.concurrency > 1:
+        list(index.check_in_concurrently((Account(*i) for i in accounts), args.concurrency))
+    else:
+        for username, password in accounts:
+            index.check_in(username, password)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    server.shutdown()
+    http_client.override_hosts({})
+
+    return {
+        'accounts': args.accounts,
+        'concurrency': args.concurrency,
+        'latency_ms': args.latency,
+        'error_rate': args.error_rate,
+        'wall_seconds': wall,
+        'process_cpu_seconds': cpu,
+        'accounts_per_second': args.accounts / wall if wall else 0.0,
+        'account_latency_p50': percentile(recorder.latencies, 50),
+        'account_latency_p99': percentile(recorder.latencies, 99),
+        'server_requests': fake.requests,
+        'server_submits': fake.submits,
+        'server_rejected': fake.rejected,
+        'rate_limits': rate_limit.summary(),
+        'phases': recorder.phases,
+    }
+
+
+def report(result):
+    print(f"账号数：{result['accounts']}，并发：{result['concurrency']}，"
+          f"注入延迟：{result['latency_ms']}ms，错误率：{result['error_rate']}")
+    print(f"总耗时：{result['wall_seconds']:.2f}s，进程 CPU：{result['process_cpu_seconds']:.2f}s"
+          f"（含模拟服务器），吞吐量：{result['accounts_per_second']:.2f} 账号/秒")
+    print(f"单账号耗时：p50 {result['account_latency_p50'] * 1000:.1f}ms，"
+          f"p99 {result['account_latency_p99'] * 1000:.1f}ms")
+    print(f"服务器请求数：{result['server_requests']}，成功提交：{result['server_submits']}，"
+          f"429 拒绝：{result['server_rejected']}")
+    for i in result['rate_limits']:
+        print(f"限流 {i['host']}：并发上限 {i['concurrency']}，每秒 {i['rate']:g} 个请求，"
+              f"等待 {i['waited']:.2f}s，降低并发 {i['backoffs']} 次")
+    print(f"{'阶段':<10}{'调用':>8}{'耗时(s)':>12}{'CPU(s)':>12}{'CPU/次(ms)':>14}")
+    for phase, stat in result['phases'].items():
+        print(f"{phase:<10}{stat['calls']:>8}{stat['wall']:>12.3f}{stat['cpu']:>12.3f}"
+              f"{stat['cpu'] / stat['calls'] * 1000:>14.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='使用本地模拟服务器压测打卡流程')
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--schools', type=int, default=10)
+    parser.add_argument('--recall-ratio', type=float, default=0.2, help='使用第二类健康打卡的学校比例')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求注入的延迟（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 503 的概率')
+    parser.add_argument('--capacity', type=int, default=0, help='模拟服务器同时处理的请求数上限，超过时返回 429')
+    parser.add_argument('--mode', choices=('main', 'check_in'), default='main',
+                        help='main 跑完整的 main_handler（含推送），check_in 只跑打卡')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', help='将结果写入 JSON 文件')
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+    result = run(args)
+    report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+推送压测：用本地模拟的 SMTP 服务器和 Server酱接口，对比每封邮件单独连接、逐个推送与 notify.Dispatcher 的耗时，
+并检查每个账号的邮件发到了自己的邮箱、连接断开后只重发一次、每个 sckey 合并后的推送包含所有账号，检查失败时以非零状态退出
+
+python -m benchmark.notify --accounts 100 --handshake 50 --drop-after 30
+"""
+import os
+import sys
+import time
+import email
+import logging
+import argparse
+
+import index
+from benchmark import fake_server, fake_smtp
+from utils import http_client, notify
+from utils.accounts import Account
+from utils.results import CheckResult
+
+
+def student_name(account):
+    return f'学生{account.phone}'
+
+
+def sample_results(account):
+    return [CheckResult(
+        account.phone, 1, 'healthy', student_name(account), {'code': '10000', 'msg': '成功'},
+        {'businessType': 'epmpics', 'jsonData': {'phonenum': account.phone}}, [], [('体温', '36.5')],
+    )]
+
+
+def run_sequential(accounts):
+    '''
+    每封邮件单独建立连接并登录，Server酱逐个推送
+    '''
+    for account in accounts:
+        results = sample_results(account)
+        dispatcher = notify.Dispatcher(index.server_push, 'bench@qq.com', 'x')
+        dispatcher.account_done(account, results)
+        dispatcher.close()
+
+
+def run_dispatcher(accounts):
+    dispatcher = notify.Dispatcher(index.server_push, 'bench@qq.com', 'x')
+    for account in accounts:
+        dispatcher.account_done(account, sample_results(account))
+    dispatcher.close()
+
+
+def check_deliveries(accounts, smtp, wanxiao, drop_after=0, pooled=True):
+    '''
+    检查推送结果
+    :param pooled: 是否共用一个 SMTP 连接（Dispatcher），是时检查连接数：每次断开只重连一次
+    :return: 失败原因列表，全部通过时为空
+    '''
+    errors = []
+    # 每个账号的邮件恰好一封，收件人是自己的邮箱，内容是自己的结果
+    mails = {}
+    for sender, recipients, data in smtp.messages:
+        message = email.message_from_bytes(data)
+        body = message.get_payload(decode=True).decode(message.get_content_charset() or 'utf-8')
+        for to in recipients:
+            mails.setdefault(to, []).append(body)
+    for account in accounts:
+        bodies = mails.pop(account.email, [])
+        if len(bodies) != 1:
+            errors.append(f'{account.email} 收到 {len(bodies)} 封邮件，应为 1 封')
+        elif student_name(account) not in bodies[0]:
+            errors.append(f'{account.email} 收到的邮件不是 {account.phone} 的结果')
+    if mails:
+        errors.append(f'邮件发给了不存在的收件人：{", ".join(sorted(mails))}')
+    if pooled:
+        expected = -(-len(accounts) // drop_after) if drop_after else 1
+        if smtp.connections != expected or smtp.logins != expected:
+            errors.append(f'SMTP 连接 {smtp.connections} 次、登录 {smtp.logins} 次，应为 {expected} 次')
+    # 每个 sckey 合并后的推送包含该 sckey 下所有账号的结果，不含其他 sckey 的账号
+    pushed = {}
+    for sckey, desp in wanxiao.pushes:
+        pushed[sckey] = pushed.get(sckey, '') + desp
+    for account in accounts:
+        name = student_name(account)
+        if name not in pushed.get(account.sckey, ''):
+            errors.append(f'{account.sckey} 的推送中没有 {account.phone} 的结果')
+        for sckey, desp in pushed.items():
+            if sckey != account.sckey and name in desp:
+                errors.append(f'{account.phone} 的结果被推送到了 {sckey}')
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='使用本地模拟服务器压测推送')
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--sckeys', type=int, default=10, help='账号共用的 sckey 个数')
+    parser.add_argument('--handshake', type=float, default=50.0, help='SMTP 建立连接和登录的延迟（毫秒）')
+    parser.add_argument('--latency', type=float, default=5.0, help='Server酱接口的延迟（毫秒）')
+    parser.add_argument('--drop-after', type=int, default=30, help='SMTP 服务器每个连接发送多少封后断开，0 表示不断开')
+    parser.add_argument('--interval', type=float, default=0.0, help='同一个 sckey 的最小发送间隔（秒）')
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    smtp = fake_smtp.FakeSmtp(args.handshake / 1000, args.drop_after)
+    smtp_server, port = fake_smtp.start(smtp)
+    wanxiao = fake_server.FakeWanxiao([], 1, 0, args.latency / 1000, 0)
+    http_server, url = fake_server.start(wanxiao)
+    http_client.override_hosts({host: url for host in fake_server.HOSTS})
+    os.environ.update(SMTP_HOST='127.0.0.1', SMTP_PORT=str(port), SMTP_SSL='0', SERVERCHAN_INTERVAL=str(args.interval))
+    accounts = [
+        Account(f'138{i:08d}', 'pw', email=f'user{i}@example.com', sckey=f'SCU{i % args.sckeys}')
+        for i in range(args.accounts)
+    ]
+
+    print(f'账号数：{args.accounts}，sckey 数：{args.sckeys}，SMTP 握手：{args.handshake}ms，'
+          f'Server酱延迟：{args.latency}ms')
+    print(f"{'方式':<12}{'耗时(s)':>10}{'连接':>8}{'登录':>8}{'邮件':>8}{'Server酱请求':>16}")
+    errors = []
+    for name, func in (('逐个推送', run_sequential), ('Dispatcher', run_dispatcher)):
+        smtp.connections = smtp.logins = 0
+        smtp.messages.clear()
+        wanxiao.requests = 0
+        wanxiao.pushes.clear()
+        start = time.perf_counter()
+        func(accounts)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<12}{elapsed:>10.2f}{smtp.connections:>8}{smtp.logins:>8}'
+              f'{len(smtp.messages):>8}{wanxiao.requests:>16}')
+        errors.extend(f'{name}：{i}' for i in check_deliveries(
+            accounts, smtp, wanxiao, args.drop_after, pooled=func is run_dispatcher,
+        ))
+    smtp_server.shutdown()
+    http_server.shutdown()
+    http_client.override_hosts({})
+    for error in errors:
+        print(f'检查失败：{error}')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
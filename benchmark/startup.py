@@ -0,0 +1,91 @@
+"""
+冷启动基准：用 python -X importtime 多次在新进程中导入 index，超过预算或导入了应按需加载的模块时以非零状态退出
+
+python -m benchmark.startup --budget 80
+python -m benchmark.startup --runs 10 --top 15 --json startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 导入 index 时不应该加载的模块，它们在第一次用到时才导入
+LAZY_MODULES = ('Crypto', 'requests', 'urllib3', 'smtplib', 'email.mime', 'asyncio', 'cProfile', 'pstats')
+
+
+def import_times(module='index'):
+    '''
+    在新进程中导入 module 一次
+    :return: {模块名: (自身耗时 us, 累计耗时 us)}
+    '''
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    # 子模块先于父模块输出，缩进表示层级；只保留 module 这棵导入树（不含 site 等解释器启动时的导入）
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+        if name.strip() == module:
+            return times
+        if not name.startswith('  '):
+            times = {}
+    return times
+
+
+def run(runs, module='index'):
+    samples = [import_times(module) for _ in range(runs)]
+    totals = [i[module][1] / 1000 for i in samples]
+    last = samples[-1]
+    return {
+        'module': module,
+        'runs': runs,
+        'median_ms': statistics.median(totals),
+        'min_ms': min(totals),
+        'max_ms': max(totals),
+        'lazy_violations': [
+            i for i in LAZY_MODULES if any(name == i or name.startswith(f'{i}.') for name in last)
+        ],
+        'slowest': sorted(
+            ({'name': name, 'self_ms': s / 1000, 'cumulative_ms': c / 1000} for name, (s, c) in last.items()),
+            key=lambda i: i['self_ms'], reverse=True,
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='index.py 冷启动（导入耗时）基准')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS') or 80),
+                        help='导入耗时中位数的上限（毫秒），默认环境变量 STARTUP_BUDGET_MS 或 80')
+    parser.add_argument('--top', type=int, default=10, help='输出自身耗时最多的模块数')
+    parser.add_argument('--json', help='将结果写入 JSON 文件')
+    args = parser.parse_args(argv)
+    result = run(args.runs)
+    result['budget_ms'] = args.budget
+    print(f"import index：中位数 {result['median_ms']:.1f}ms（最小 {result['min_ms']:.1f}ms，"
+          f"最大 {result['max_ms']:.1f}ms，{args.runs} 次），预算 {args.budget:.1f}ms")
+    print(f"{'模块':<40}{'自身(ms)':>12}{'累计(ms)':>12}")
+    for i in result['slowest'][:args.top]:
+        print(f"{i['name']:<40}{i['self_ms']:>12.2f}{i['cumulative_ms']:>12.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    failed = False
+    if result['lazy_violations']:
+        print(f"导入 index 时加载了应按需导入的模块：{', '.join(result['lazy_violations'])}")
+        failed = True
+    if result['median_ms'] > args.budget:
+        print(f"冷启动超出预算：{result['median_ms']:.1f}ms > {args.budget:.1f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
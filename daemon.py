@@ -0,0 +1,254 @@
+"""
+常驻模式：登录一次后保持会话，每天做一次健康打卡，并按 ruleList 的时间段调度校内打卡（clockSign1/2/3），
+每个账号的提交时间在时间段内按手机号分散，避免整点集中请求；每个时间段结束时推送该时间段的打卡结果
+
+python daemon.py
+"""
+import os
+import time
+import hashlib
+import logging
+import datetime
+import threading
+
+import index
+from utils import breaker, daily_state, metrics, notify
+from utils.accounts import open_accounts
+from utils.daily_state import get_daily_state
+from utils.results import CheckResult
+from utils.retry import budget as retry_budget
+from utils.scheduler import Scheduler
+
+# ruleList 中没有 startTime / endTime 时使用的时间段，与 get_ap 的上午、下午、晚上对应，上午从 6 点开始
+CAMPUS_WINDOWS = (('06:00', '12:00'), ('12:00', '17:00'), ('17:00', '23:00'))
+# 每个时间段最后留出的比例，给提交失败后的重新登录和重试
+WINDOW_MARGIN = float(os.environ.get('DAEMON_WINDOW_MARGIN') or 0.2)
+# 每天北京时间几点几分重新规划当天的打卡
+PLAN_TIME = os.environ.get('DAEMON_PLAN_TIME') or '00:05'
+
+
+def beijing_now():
+    return datetime.datetime.utcnow() + datetime.timedelta(hours=8)
+
+
+def beijing_timestamp(date, hhmm):
+    '''
+    :param date: 北京时间的日期
+    :param hhmm: "07:30"
+    :return: 对应的 time.time() 时间戳
+    '''
+    hour, minute = (int(i) for i in hhmm.split(':')[:2])
+    local = datetime.datetime(date.year, date.month, date.day, hour, minute)
+    return (local - datetime.timedelta(hours=8) - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+def rule_window(rule, position, date):
+    '''
+    校内打卡规则的时间段
+    :param rule: ruleList 中的一项
+    :param position: 规则的序号，没有时间信息时按序号使用 CAMPUS_WINDOWS
+    :return: (开始时间戳, 结束时间戳)，无法确定时间段时返回 None
+    '''
+    if rule.get('startTime') and rule.get('endTime'):
+        start, end = rule['startTime'], rule['endTime']
+    elif position < len(CAMPUS_WINDOWS):
+        start, end = CAMPUS_WINDOWS[position]
+    else:
+        return None
+    return beijing_timestamp(date, start), beijing_timestamp(date, end)
+
+
+def spread_time(key, start, end, now):
+    '''
+    在时间段内按 key 的哈希均匀分散提交时间，同一个账号每天的提交时间基本固定
+    :return: 提交时间戳，时间段已经过去时返回 None
+    '''
+    fraction = int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big') / 2 ** 64
+    usable = (end - start) * (1 - WINDOW_MARGIN)
+    when = start + fraction * usable
+    if when >= now:
+        return when
+    if now >= end:
+        return None
+    # 已经进入时间段，在剩余时间内分散
+    return now + fraction * (end - now) * (1 - WINDOW_MARGIN)
+
+
+class CampusDaemon:
+    '''
+    常驻打卡进程，保存每个账号的 token 和个人信息，打卡前只校验 token，失效时才重新登录
+    '''
+
+    def __init__(self, accounts, workers=4):
+        self.accounts = list(accounts)
+        self.scheduler = Scheduler(workers)
+        self.tokens = {}
+        self.user_infos = {}
+        self.results = []
+        self.flush_times = set()
+        # 当天还没有规划完的账号数，全部规划完后统一推送一次健康打卡的结果
+        self.planning = 0
+        # 整个进程共用一个推送分发器，SMTP 连接在多次推送之间保持
+        self.notifier = notify.Dispatcher(index.server_push, os.environ.get('SEND_EMAIL'), os.environ.get('SEND_PWD'))
+        self._lock = threading.Lock()
+
+    def token(self, account):
+        '''
+        获取账号的 token，已有的 token 仍然有效时直接使用；
+        每次最多校验一次 token：已有的 token 失效时直接重新登录，没有时才经由 get_token 校验已保存的会话
+        '''
+        token = self.tokens.get(account.phone)
+        if token:
+            if index.check_token(token):
+                return token
+            token = index.relogin(account.phone, account.password)
+        else:
+            token = index.get_token(account.phone, account.password)
+        if token:
+            self.tokens[account.phone] = token
+        return token
+
+    def add_results(self, account, checks):
+        results = [CheckResult.from_check(account.phone, i) for i in checks]
+        with self._lock:
+            self.results.extend(results)
+        self.notifier.account_done(account, results)
+
+    def check_in(self, account, token, user_info):
+        '''
+        健康打卡
+        '''
+        checks = index.submit_check_in(account.phone, token, user_info, account.overrides())
+        self.add_results(account, checks)
+
+    def plan_day(self):
+        '''
+        规划当天所有账号的打卡，并安排第二天的规划
+        '''
+        date = beijing_now().date()
+        logging.info(f'开始规划 {date} 的打卡，共 {len(self.accounts)} 个账号')
+        # 重试预算、熔断器和指标按天计算：导出前一天的指标后重新开始
+        metrics.export()
+        metrics.configure(os.environ.get('METRICS_DIR'))
+        retry_budget.reset()
+        breaker.reset_all()
+        with self._lock:
+            self.flush_times.clear()
+            self.planning = len(self.accounts)
+        for account in self.accounts:
+            self.scheduler.schedule(0, self.plan_account, account, date)
+        self.scheduler.schedule(beijing_timestamp(date + datetime.timedelta(days=1), PLAN_TIME), self.plan_day)
+
+    def plan_account(self, account, date):
+        '''
+        登录并完成当天的健康打卡，再按规则时间段安排校内打卡；
+        最后一个账号规划完成时（包括登录失败）推送一次健康打卡的结果
+        '''
+        try:
+            self._plan_account(account, date)
+        finally:
+            with self._lock:
+                self.planning -= 1
+                planned = self.planning == 0
+            if planned:
+                self.schedule_flush(time.time())
+
+    def _plan_account(self, account, date):
+        state = get_daily_state()
+        token = self.token(account)
+        user_info = index.get_user_info(token) if token else None
+        if not user_info:
+            self.check_in(account, token, user_info)
+            return
+        self.user_infos[account.phone] = user_info
+        if not (state and state.succeeded(account.phone, daily_state.HEALTHY, str(date))):
+            self.check_in(account, token, user_info)
+        rules = index.get_id_list(token, user_info.get('customerAppTypeId')) or index.get_id_list_v1(token, user_info['customerId'])
+        if not rules:
+            logging.info(f'{account.phone[:4]}：没有校内打卡')
+            return
+        now = time.time()
+        for position, rule in enumerate(rules):
+            if state and state.succeeded(account.phone, rule['templateid'], str(date)):
+                continue
+            window = rule_window(rule, position, date)
+            if not window:
+                continue
+            when = spread_time(f'{account.phone}:{rule["templateid"]}', *window, now)
+            if when is None:
+                continue
+            logging.info(f'{account.phone[:4]}：{rule["templateid"]} 将在 '
+                         f'{datetime.datetime.utcfromtimestamp(when + 8 * 3600):%H:%M:%S} 打卡')
+            self.scheduler.schedule(when, self.campus_check_in, account, rule)
+            self.schedule_flush(window[1])
+
+    def schedule_flush(self, when):
+        with self._lock:
+            if when in self.flush_times:
+                return
+            self.flush_times.add(when)
+        self.scheduler.schedule(when, self.flush)
+
+    def campus_check_in(self, account, rule):
+        '''
+        提交一次校内打卡
+        '''
+        token = self.token(account)
+        user_info = self.user_infos.get(account.phone)
+        if not token or not user_info:
+            errmsg = f"{account.phone[:4]}，获取token失败，{rule['templateid']}打卡失败"
+            self.add_results(account, [{"status": 0, "errmsg": errmsg}])
+            return
+        json2 = {
+            "businessType": "epmpics",
+            "jsonData": {
+                "templateid": rule['templateid'],
+                "customerAppTypeRuleId": rule['id'],
+                "stuNo": user_info['stuNo'],
+                "token": token,
+            },
+            "method": "userComeAppSchool",
+            "token": token,
+        }
+        campus_dict = index.get_post_json(json2, user_info)
+        if not campus_dict:
+            check = {"status": 0, "errmsg": f"{account.phone[:4]}，获取{rule['templateid']}打卡数据失败"}
+        else:
+            index.apply_overrides(campus_dict, account.overrides())
+            check = index.campus_check_in(account.phone, token, campus_dict, rule['id'])
+        index.record_daily_state(account.phone, rule['templateid'], check)
+        self.add_results(account, [check])
+
+    def flush(self):
+        '''
+        推送上次推送之后的打卡结果
+        '''
+        with self._lock:
+            results, self.results = self.results, []
+        if results:
+            index.push_report(results, [], notifier=self.notifier)
+        index.stop_key_pool()
+        index.save_session_store()
+        index.get_type_store().save()
+        index.get_template_cache().save()
+
+    def run(self):
+        self.plan_day()
+        self.scheduler.run()
+
+
+def main():
+    index.initLogging()
+    workers = int(os.environ.get('CONCURRENCY') or 4)
+    daemon = CampusDaemon(open_accounts(), workers)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.scheduler.stop()
+    finally:
+        daemon.notifier.close()
+        metrics.export()
+
+
+if __name__ == '__main__':
+    main()
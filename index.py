@@ -1,14 +1,29 @@
+import io
+import sys
 import time
 import os
-import smtplib
+import argparse
 import datetime
 import json
 import logging
-import requests
 
-from email.mime.text import MIMEText
+import login
+from login.session_store import MemorySessionStore, get_session_store
+from utils import breaker, checkin_type, daily_state, http_client, metrics, profiler, rate_limit, report, shard
+from utils.accounts import open_accounts
+from utils.checkin_type import get_type_store
+from utils.daily_state import get_daily_state
+from utils.rule_cache import get_rule_cache
+from utils.runtime import get_runtime
+from utils.template_cache import get_template_cache
+from utils.results import CheckResult, ResultFiles, ResultSink
+from utils.retry import FatalError, RetryPolicy, budget as retry_budget
 
-from login import CampusCard
+# 登录失败时不再重试的 code_：4 该手机号未注册完美校园，5 密码错误 / 新设备需要验证码
+FATAL_LOGIN_CODES = {"4", "5"}
+# 9 次重试最多共等待 2 + 4 + 8 × 7 = 62 秒，计入抖动平均约 46 秒，与原来每次间隔 5 秒相当
+LOGIN_RETRY = RetryPolicy(attempts=10, base_delay=2, max_delay=8)
+FETCH_RETRY = RetryPolicy(attempts=3, base_delay=1, max_delay=8)
 
 
 def initLogging():
@@ -23,25 +38,133 @@ def get_token(username, password):
     :param password: 密码
     :return:
     """
-    for _ in range(10):
-        user_dict = CampusCard(username, password).user_info
-        if user_dict["login"]:
-            return user_dict["sessionId"]
-        elif user_dict['login_msg']['message_'] == "该手机号未注册完美校园":
-            return None
-        elif user_dict['login_msg']['message_'].startswith("密码错误"):
-            return None
-        else:
-            logging.warning('正在尝试重新登录......')
-            time.sleep(5)
-    return None
+    return login_user(username, password)[0]
+
+
+def login_user(username, password, key_pool_size=0):
+    """
+    获取用户令牌，已保存的会话仍然有效时直接沿用
+    :param username: 账号
+    :param password: 密码
+    :param key_pool_size: 需要登录时 RSA 密钥对池至少保持的大小，并发打卡时为并发数
+    :return: (token, user_info)，沿用已保存的会话时 user_info 为校验会话时得到的个人信息，
+             不必再调用 get_user_info；重新登录时为 None，登录失败时 token 为 None
+    """
+    session_store = current_session_store()
+    saved_info = session_store.get(username)
+    if saved_info and saved_info.get("sessionId"):
+        user_info = check_token(saved_info["sessionId"])
+        if user_info:
+            logging.info(f"{username[:4]}：沿用已保存的登录会话")
+            if isinstance(session_store, MemorySessionStore):
+                session_store.hit()
+            return saved_info["sessionId"], user_info
+        logging.info(f"{username[:4]}：已保存的登录会话失效，重新登录")
+    return relogin(username, password, saved_info, key_pool_size), None
+
+
+def relogin(username, password, saved_info=None, key_pool_size=0):
+    """
+    不校验已保存的会话，直接重新登录，沿用已保存的设备信息；调用方已经确认会话失效时使用
+    :param username: 账号
+    :param password: 密码
+    :param saved_info: 已保存的会话，None 时从会话存储中读取
+    :param key_pool_size: 见 login_user
+    :return: token，登录失败时返回 None
+    """
+    session_store = current_session_store()
+    if saved_info is None:
+        saved_info = session_store.get(username)
+    start_key_pool(key_pool_size)
+    campus_card = login.CampusCard(username, password, saved_info, auto_login=False)
+    try:
+        user_dict = LOGIN_RETRY.call(login_campus_card, campus_card, warning=f"{username[:4]}：登录失败")
+    except Exception as e:
+        logging.warning(f"{username[:4]}：{e}")
+        return None
+    session_store.set(username, user_dict)
+    return user_dict["sessionId"]
+
+
+def current_session_store():
+    """
+    :return: SESSION_STORE 指定的会话存储；未设置时登录会话保存在进程内存中，云函数热启动时复用
+    """
+    return get_session_store() or get_runtime().sessions
+
+
+def save_session_store():
+    """
+    将本次运行中登录得到的会话写入 SESSION_STORE
+    """
+    session_store = get_session_store()
+    if session_store is not None:
+        session_store.save()
+
+
+def start_key_pool(size=0):
+    """
+    第一个需要登录的账号到来时才创建 RSA 密钥对池并开始后台生成，之后每次登录前唤醒后台线程补充；
+    所有账号都沿用已保存的会话或被 DAILY_STATE 跳过时，不导入 pycryptodome、不生成密钥
+    :param size: 池至少保持的大小，0 表示使用 RSA_POOL_SIZE
+    """
+    key_pool = login.rsa_encrypt.get_key_pool()
+    if key_pool.size < size:
+        key_pool.size = size
+    key_pool.start()
+
+
+def stop_key_pool():
+    """
+    本次运行的登录已经结束，密钥对池停止后台补充；池还没有创建时不导入 pycryptodome
+    """
+    rsa_encrypt = sys.modules.get("login.rsa_encrypt")
+    if rsa_encrypt is not None and rsa_encrypt._key_pool is not None:
+        rsa_encrypt._key_pool.stop()
+
+
+def login_campus_card(campus_card):
+    """
+    交换密钥并登录一次，交换密钥失败时不会继续登录，重试时沿用已生成的 RSA 密钥和 deviceId
+    :param campus_card: CampusCard
+    :return: 登录成功后的设备信息
+    """
+    user_dict = campus_card.user_info
+    if not user_dict["appKey"] and not campus_card.exchange_secret():
+        raise ConnectionError("与完美校园交换密钥失败")
+    if campus_card.login():
+        return user_dict
+    # 登录失败后会话作废，下次重试重新交换密钥
+    user_dict["appKey"] = ""
+    login_msg = user_dict.get("login_msg") or {}
+    if str(login_msg.get("code_")) in FATAL_LOGIN_CODES:
+        raise FatalError(login_msg.get("message_"))
+    raise ConnectionError(login_msg.get("message_"))
+
+
+@metrics.timed("check_token", ok=bool)
+def check_token(token):
+    """
+    用一次请求校验已保存的用户令牌是否仍然有效，校验用的就是 getUserInfo 接口，返回的个人信息可以直接使用
+    :param token: 用户令牌
+    :return: 有效时返回与 get_user_info 相同的个人信息，无效返回 None
+    """
+    try:
+        res = http_client.post(
+            "https://reportedh5.17wanxiao.com/api/clock/school/getUserInfo",
+            data={"appClassify": "DK", "token": token},
+            timeout=10,
+        )
+        return res.json().get("userInfo") or None
+    except:
+        return None
 
 
 def get_school_name(token):
     post_data = {"token": token, "method": "WX_BASE_INFO", "param": "%7B%7D"}
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     try:
-        res = requests.post(
+        res = http_client.post(
             "https://server.59wanmei.com/YKT_Interface/xyk",
             data=post_data,
             headers=headers,
@@ -51,6 +174,7 @@ def get_school_name(token):
         return "泪目，没获取到学校名字"
 
 
+@metrics.timed("user_info", ok=lambda r: r is not None)
 def get_user_info(token):
     """
     用来获取custom_id，即类似与打卡模板id
@@ -58,18 +182,19 @@ def get_user_info(token):
     :return: return
     """
     data = {"appClassify": "DK", "token": token}
-    for _ in range(3):
-        try:
-            res = requests.post(
-                "https://reportedh5.17wanxiao.com/api/clock/school/getUserInfo", data=data
-            )
-            user_info = res.json()["userInfo"]
-            logging.info('获取个人信息成功')
-            return user_info
-        except:
-            logging.warning('获取个人信息失败，正在重试......')
-            time.sleep(1)
-    return None
+
+    def fetch():
+        res = http_client.post(
+            "https://reportedh5.17wanxiao.com/api/clock/school/getUserInfo", data=data
+        )
+        return res.json()["userInfo"]
+
+    try:
+        user_info = FETCH_RETRY.call(fetch, warning='获取个人信息失败')
+    except:
+        return None
+    logging.info('获取个人信息成功')
+    return user_info
 
 
 def get_post_json(post_json, user_info):
@@ -78,60 +203,81 @@ def get_post_json(post_json, user_info):
     :param jsons: 用来获取打卡数据的json字段
     :return:
     """
-    for _ in range(3):
-        try:
-            res = requests.post(
-                url="https://reportedh5.17wanxiao.com/sass/api/epmpics",
-                json=post_json,
-                timeout=10,
-            ).json()
-        # print(res)
-        except:
-            logging.warning("获取完美校园打卡post参数失败，正在重试...")
-            time.sleep(1)
-            continue
-        if res["code"] != "10000":
-            # logging.warning(res)
+    template_cache = get_template_cache()
+    cache_key = None
+    if user_info:
+        cache_key = (user_info["customerId"], post_json["jsonData"]["templateid"], user_info["userId"])
+    data = template_cache.get(*cache_key) if cache_key else None
+    if data:
+        logging.info("使用缓存的打卡模板")
+    else:
+        data = fetch_post_data(post_json)
+        if data is None:
             return None
-        data = json.loads(res["data"])
-        # print(data)
-        post_dict = {
-            "areaStr": data["areaStr"],
-            "deptStr": {
-                "deptid": user_info["classId"],
-                "text": user_info["classDescription"],
-            },
+        if cache_key:
+            template_cache.put(*cache_key, data)
+    post_dict = {
+        "areaStr": data["areaStr"],
+        "deptStr": {
             "deptid": user_info["classId"],
-            "customerid": user_info["customerId"],
-            "userid": str(user_info["userId"]),
-            "username": user_info["username"],
-            "stuNo": user_info["stuNo"],
-            "phonenum": data["phonenum"],
-            "templateid": data["templateid"],
-            "updatainfo": [
-                {"propertyname": i["propertyname"], "value": i["value"]}
-                for i in data["cusTemplateRelations"]
-            ],
-            "updatainfo_detail": [
-                {
-                    "propertyname": i["propertyname"],
-                    "checkValues": i["checkValues"],
-                    "description": i["decription"],
-                    "value": i["value"],
-                }
-                for i in data["cusTemplateRelations"]
-            ],
-            "checkbox": [
-                {"description": i["decription"], "value": i["value"]}
-                for i in data["cusTemplateRelations"]
-            ],
-        }
-        # print(json.dumps(post_dict, sort_keys=True, indent=4, ensure_ascii=False))
-        logging.info("获取完美校园打卡post参数成功")
-        return post_dict
-    return None
+            "text": user_info["classDescription"],
+        },
+        "deptid": user_info["classId"],
+        "customerid": user_info["customerId"],
+        "userid": str(user_info["userId"]),
+        "username": user_info["username"],
+        "stuNo": user_info["stuNo"],
+        "phonenum": data["phonenum"],
+        "templateid": data["templateid"],
+        "updatainfo": [
+            {"propertyname": i["propertyname"], "value": i["value"]}
+            for i in data["cusTemplateRelations"]
+        ],
+        "updatainfo_detail": [
+            {
+                "propertyname": i["propertyname"],
+                "checkValues": i["checkValues"],
+                "description": i["decription"],
+                "value": i["value"],
+            }
+            for i in data["cusTemplateRelations"]
+        ],
+        "checkbox": [
+            {"description": i["decription"], "value": i["value"]}
+            for i in data["cusTemplateRelations"]
+        ],
+    }
+    # print(json.dumps(post_dict, sort_keys=True, indent=4, ensure_ascii=False))
+    logging.info("获取完美校园打卡post参数成功")
+    return post_dict
+
+
+@metrics.timed("template", ok=lambda r: r is not None)
+def fetch_post_data(post_json):
+    """
+    请求打卡模板数据
+    :param post_json: 用来获取打卡数据的json字段
+    :return: 接口返回的 data，不是第一类健康打卡时返回 None
+    """
+    def fetch():
+        return http_client.post(
+            url="https://reportedh5.17wanxiao.com/sass/api/epmpics",
+            json=post_json,
+            timeout=10,
+        ).json()
+
+    try:
+        res = FETCH_RETRY.call(fetch, warning="获取完美校园打卡post参数失败")
+    except:
+        return None
+    # print(res)
+    if res["code"] != "10000":
+        # logging.warning(res)
+        return None
+    return json.loads(res["data"])
 
 
+@metrics.timed("submit", ok=lambda r: r["status"])
 def healthy_check_in(token, username, post_dict):
     """
     第一类健康打卡
@@ -161,7 +307,7 @@ def healthy_check_in(token, username, post_dict):
         },
     }
     try:
-        res = requests.post(
+        res = http_client.post(
             "https://reportedh5.17wanxiao.com/sass/api/epmpics", json=check_json
         ).json()
         # 以json格式打印json字符串
@@ -179,30 +325,31 @@ def healthy_check_in(token, username, post_dict):
         return {"status": 0, "errmsg": errmsg}
 
 
+@metrics.timed("template", ok=lambda r: r is not None)
 def get_recall_data(token):
     """
     获取第二类健康打卡的打卡数据
     :param token: 用户令牌
     :return: 返回dict数据
     """
-    for _ in range(3):
-        try:
-            res = requests.post(
-                url="https://reportedh5.17wanxiao.com/api/reported/recall",
-                data={"token": token},
-                timeout=10,
-            ).json()
-        except:
-            logging.warning("获取完美校园打卡post参数失败，正在重试...")
-            time.sleep(1)
-            continue
-        if res["code"] == 0:
-            logging.info("获取完美校园打卡post参数成功")
-            return res["data"]
+    def fetch():
+        return http_client.post(
+            url="https://reportedh5.17wanxiao.com/api/reported/recall",
+            data={"token": token},
+            timeout=10,
+        ).json()
+
+    try:
+        res = FETCH_RETRY.call(fetch, warning="获取完美校园打卡post参数失败")
+    except:
         return None
+    if res["code"] == 0:
+        logging.info("获取完美校园打卡post参数成功")
+        return res["data"]
     return None
 
 
+@metrics.timed("submit", ok=lambda r: r["status"])
 def receive_check_in(token, custom_id, post_dict):
     """
     第二类健康打卡
@@ -258,7 +405,7 @@ def receive_check_in(token, custom_id, post_dict):
         "content-type": "application/x-www-form-urlencoded;charset=UTF-8",
     }
     try:
-        res = requests.post(
+        res = http_client.post(
             "https://reportedh5.17wanxiao.com/api/reported/receive",
             headers=headers,
             data=check_json,
@@ -303,11 +450,15 @@ def get_ap():
 
 def get_id_list(token, custom_id):
     """
-    通过校内模板id获取校内打卡具体的每个时间段id
+    通过校内模板id获取校内打卡具体的每个时间段id，同一学校的结果会被缓存
     :param token: 用户令牌
     :param custom_id: 校内打卡模板id
     :return: 返回校内打卡id列表
     """
+    return get_rule_cache().get(("rules", custom_id), lambda: fetch_id_list(token, custom_id))
+
+
+def fetch_id_list(token, custom_id):
     post_data = {
         "customerAppTypeId": custom_id,
         "longitude": "",
@@ -315,7 +466,7 @@ def get_id_list(token, custom_id):
         "token": token,
     }
     try:
-        res = requests.post(
+        res = http_client.post(
             "https://reportedh5.17wanxiao.com/api/clock/school/rules", data=post_data
         )
         # print(res.text)
@@ -324,21 +475,28 @@ def get_id_list(token, custom_id):
         return None
 
 
-def get_id_list_v1(token):
+def get_id_list_v1(token, customer_id=None):
     """
     通过校内模板id获取校内打卡具体的每个时间段id（初版,暂留）
     :param token: 用户令牌
+    :param customer_id: 学校id，传入时同一学校的结果会被缓存
     :return: 返回校内打卡id列表
     """
+    if customer_id is None:
+        return fetch_id_list_v1(token)
+    return get_rule_cache().get(("childApps", customer_id), lambda: fetch_id_list_v1(token))
+
+
+def fetch_id_list_v1(token):
     post_data = {"appClassify": "DK", "token": token}
     try:
-        res = requests.post(
+        res = http_client.post(
             "https://reportedh5.17wanxiao.com/api/clock/school/childApps",
             data=post_data,
-        )
-        if res.json()["appList"]:
+        ).json()
+        if res["appList"]:
             id_list = sorted(
-                res.json()["appList"][-1]["customerAppTypeRuleList"],
+                res["appList"][-1]["customerAppTypeRuleList"],
                 key=lambda x: x["id"],
             )
             res_dict = [
@@ -351,6 +509,7 @@ def get_id_list_v1(token):
         return None
 
 
+@metrics.timed("submit", ok=lambda r: r["status"])
 def campus_check_in(username, token, post_dict, id):
     """
     校内打卡
@@ -384,7 +543,7 @@ def campus_check_in(username, token, post_dict, id):
     }
     # print(check_json)
     try:
-        res = requests.post(
+        res = http_client.post(
             "https://reportedh5.17wanxiao.com/sass/api/epmpics", json=check_json
         ).json()
 
@@ -413,21 +572,55 @@ def campus_check_in(username, token, post_dict, id):
         return dict(status=0, errmsg=errmsg)
 
 
-def check_in(username, password):
-    # 登录获取token用于打卡
-    token = get_token(username, password)
+def check_in(username, password, overrides=None):
+    # 登录获取token用于打卡，沿用已保存的会话时校验会话的请求已经返回了个人信息
+    token, user_info = login_user(username, password)
+    profiler.mark("after_login")
     # print(token)
+
+    # 获取学校使用打卡模板Id
+    if user_info is None:
+        user_info = get_user_info(token)
+    return submit_check_in(username, token, user_info, overrides)
+
+
+def apply_overrides(post_dict, overrides):
+    """
+    用账号的个性化设置覆盖打卡数据
+    :param post_dict: get_post_json / get_recall_data 获取的打卡数据
+    :param overrides: {'areaStr': 打卡地址, 'temperature': 体温}
+    """
+    if not overrides:
+        return
+    if "updatainfo" in post_dict:
+        if overrides.get("areaStr"):
+            post_dict["areaStr"] = overrides["areaStr"]
+        if overrides.get("temperature"):
+            for j in post_dict["updatainfo"]:
+                if j["propertyname"] == "temperature":
+                    j["value"] = overrides["temperature"]
+    elif overrides.get("temperature"):
+        post_dict["temperature"] = overrides["temperature"]
+
+
+def submit_check_in(username, token, user_info, overrides=None):
+    """
+    登录之后的打卡流程：获取打卡数据并提交
+    :param username: 手机号
+    :param token: 用户令牌
+    :param user_info: get_user_info 获取的个人信息
+    :param overrides: 账号的个性化设置，见 apply_overrides
+    :return: 打卡结果列表
+    """
     check_dict_list = []
     # 获取现在是上午，还是下午，还是晚上
     # ape_list = get_ap()
 
-    # 获取学校使用打卡模板Id
-    user_info = get_user_info(token)
-
     if not token:
         errmsg = f"{username[:4]}，获取token失败，打卡失败"
         logging.warning(errmsg)
         check_dict_list.append({"status": 0, "errmsg": errmsg})
+        record_daily_state(username, daily_state.HEALTHY, check_dict_list[-1])
         return check_dict_list
 
     # 获取第一类健康打卡的参数
@@ -436,9 +629,23 @@ def check_in(username, password):
         "jsonData": {"templateid": "pneumonia", "token": token},
         "method": "userComeApp",
     }
-    post_dict = get_post_json(json1, user_info)
+    # 已知学校使用第二类健康打卡时，跳过第一类打卡参数的获取
+    type_store = get_type_store()
+    customer_id = user_info["customerId"] if user_info else None
+    remembered_recall = type_store.get(customer_id) == checkin_type.RECALL
+    post_dict = None if remembered_recall else get_post_json(json1, user_info)
+    recall_dict = None
+    if not post_dict:
+        # 获取第二类健康打卡参数
+        recall_dict = get_recall_data(token)
+        if not recall_dict and remembered_recall:
+            # 记录的类型已失效（例如学校换回了第一类），删除记录后按原流程探测第一类
+            logging.info(f"{username[:4]}：学校 {customer_id} 的第二类健康打卡数据获取失败，重新探测第一类")
+            type_store.forget(customer_id)
+            post_dict = get_post_json(json1, user_info)
 
     if post_dict:
+        type_store.record(customer_id, checkin_type.EPMPICS)
         # 第一类健康打卡
         # print(post_dict)
 
@@ -454,14 +661,24 @@ def check_in(username, password):
         #                        '"town":"","pois":"河南师范大学(东区)","lng":113.91572178314209,' \
         #                        '"lat":35.327695868943984,"address":"牧野区建设东路89号河南师范大学(东区)","text":"河南省-新乡市",' \
         #                        '"code":""} '
+        apply_overrides(post_dict, overrides)
+        profiler.mark("after_template")
         healthy_check_dict = healthy_check_in(token, username, post_dict)
         check_dict_list.append(healthy_check_dict)
-    else:
-        # 获取第二类健康打卡参数
-        post_dict = get_recall_data(token)
+    elif recall_dict:
+        type_store.record(customer_id, checkin_type.RECALL)
+        apply_overrides(recall_dict, overrides)
+        profiler.mark("after_template")
         # 第二类健康打卡
-        healthy_check_dict = receive_check_in(token, user_info["customerId"], post_dict)
+        healthy_check_dict = receive_check_in(token, customer_id, recall_dict)
         check_dict_list.append(healthy_check_dict)
+    else:
+        errmsg = f"{username[:4]}，获取健康打卡数据失败，打卡失败"
+        logging.warning(errmsg)
+        healthy_check_dict = {"status": 0, "errmsg": errmsg}
+        check_dict_list.append(healthy_check_dict)
+    record_daily_state(username, daily_state.HEALTHY, healthy_check_dict)
+    profiler.mark("after_submit")
 
     # # 获取校内打卡ID
     # id_list = get_id_list(token, user_info.get('customerAppTypeId'))
@@ -492,6 +709,168 @@ def check_in(username, password):
     return check_dict_list
 
 
+def record_daily_state(username, check_type, check):
+    """
+    记录账号当天的打卡结果，未设置 DAILY_STATE 时不记录
+    :param username: 手机号
+    :param check_type: daily_state.HEALTHY 或校内打卡的 templateid
+    :param check: 打卡结果
+    """
+    state = get_daily_state()
+    if state:
+        state.record(username, check_type, check_succeeded(check), check.get("errmsg"))
+
+
+def check_succeeded(check):
+    """
+    判断打卡是否真正成功：请求发出后还要看接口返回的 code（第一类和校内打卡为 "10000"，第二类为 0）
+    :param check: 打卡结果
+    """
+    if not check["status"]:
+        return False
+    res = check.get("res")
+    if isinstance(res, dict):
+        return str(res.get("code")) in ("10000", "0")
+    return True
+
+
+def pending_accounts(accounts, only_failed=False):
+    """
+    跳过今天已经打卡成功的账号，未设置 DAILY_STATE 时原样返回
+    :param accounts: Account 迭代器
+    :param only_failed: 只返回今天打卡失败过的账号
+    :return: Account 迭代器
+    """
+    state = get_daily_state()
+    if not state:
+        if only_failed:
+            logging.warning("未设置 DAILY_STATE，无法只处理失败的账号")
+        yield from accounts
+        return
+    failed = state.failed() if only_failed else None
+    for account in accounts:
+        if failed is not None and account.phone not in failed:
+            continue
+        if state.succeeded(account.phone):
+            logging.info(f"{account.phone[:4]}：今天已打卡成功，跳过")
+            metrics.inc("check_ins", outcome="skipped")
+            continue
+        yield account
+
+
+async def check_in_async(account, executor, key_pool_size=0):
+    """
+    单个账号的异步打卡流程，登录、获取信息、提交等阻塞步骤交给线程池执行
+    :param account: utils.accounts.Account
+    :param executor: 执行阻塞步骤的线程池
+    :param key_pool_size: 见 login_user
+    :return: 打卡结果列表，与 check_in 相同
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    # 经由 profiler.call 执行，开启性能分析时工作线程中的耗时也会被记录
+    token, user_info = await loop.run_in_executor(
+        executor, profiler.call, login_user, account.phone, account.password, key_pool_size
+    )
+    profiler.mark("after_login")
+    if user_info is None:
+        user_info = await loop.run_in_executor(executor, profiler.call, get_user_info, token)
+    return await loop.run_in_executor(
+        executor, profiler.call, submit_check_in, account.phone, token, user_info, account.overrides()
+    )
+
+
+def check_in_concurrently(accounts, concurrency):
+    """
+    多账号并发打卡，按账号顺序逐个返回结果。
+    滑动窗口：同时最多 concurrency 个账号在打卡，一个完成就补上下一个；
+    已完成但排在未完成账号之后的结果暂存，最多暂存 concurrency * 4 个，内存占用不随账号总数增长
+    :param accounts: Account 迭代器
+    :param concurrency: 同时打卡的账号数
+    :return: (Account, 打卡结果列表) 的迭代器
+    """
+    # asyncio 和线程池只在并发打卡时用到，按需导入减少冷启动时间
+    import asyncio
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    accounts = iter(accounts)
+    window_size = concurrency * 4
+    # 整个过程只用一个事件循环，每次只运行到有账号完成为止，以便在两次之间逐个返回结果
+    loop = asyncio.new_event_loop()
+    window = deque()
+    running = set()
+    try:
+        with ThreadPoolExecutor(concurrency, "check-in") as executor:
+            exhausted = False
+            while True:
+                while not exhausted and len(running) < concurrency and len(window) < window_size:
+                    account = next(accounts, None)
+                    if account is None:
+                        exhausted = True
+                        break
+                    # RSA 密钥生成最耗 CPU，交给密钥对池的后台线程，池大小至少与并发数相同（第一次登录时才创建，见 start_key_pool）
+                    task = loop.create_task(check_in_async(account, executor, concurrency))
+                    window.append((account, task))
+                    running.add(task)
+                while window and window[0][1].done():
+                    account, task = window.popleft()
+                    yield account, task.result()
+                if not window and exhausted:
+                    return
+                if running:
+                    done, _ = loop.run_until_complete(asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED))
+                    running -= done
+    finally:
+        # 调用方提前结束迭代时，取消还没完成的账号并等待它们退出后再关闭事件循环
+        if running:
+            for task in running:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*running, return_exceptions=True))
+        loop.close()
+
+
+def format_breaker_log(breaker_list):
+    """
+    生成接口熔断状态的推送内容，所有接口都没有失败时返回空字符串
+    :param breaker_list: breaker.summary() 的结果
+    :return: markdown 文本
+    """
+    breaker_list = [i for i in breaker_list if i["failures"] or i["rejected"]]
+    if not breaker_list:
+        return ""
+    rows = "\n".join(
+        f"| {i['name']} | {i['state']} | {i['successes']} | {i['failures']} | {i['rejected']} |"
+        for i in breaker_list
+    )
+    return f"""------
+#### 接口熔断状态：
+| 接口 | 状态 | 成功 | 失败 | 熔断跳过 |
+| :--- | :--- | :--- | :--- | :--- |
+{rows}
+------
+"""
+
+
+def format_template_changes(changes):
+    """
+    生成打卡模板变化的推送内容
+    :param changes: TemplateCache.changes
+    :return: markdown 文本
+    """
+    rows = "\n".join(
+        f"| {customerid} | {templateid} | {old_hash[:8]} | {new_hash[:8]} |"
+        for customerid, templateid, old_hash, new_hash in changes
+    )
+    return f"""------
+#### 打卡模板发生变化，请检查打卡字段：
+| 学校 | 模板 | 原模板 | 新模板 |
+| :--- | :--- | :--- | :--- |
+{rows}
+------
+"""
+
+
+@metrics.timed("server_push", ok=bool)
 def server_push(sckey, desp):
     """
     Server酱推送：https://sc.ftqq.com/3.version
@@ -504,209 +883,248 @@ def server_push(sckey, desp):
     send_url = f"https://sc.ftqq.com/{sckey}.send"
     params = {"text":"打卡", "desp": desp}
     # 发送消息
-    for _ in range(3):
-        try:
-            res = requests.post(send_url, data=params)
-            if not res.json()["errno"]:
-                logging.info("Server酱推送服务成功")
-                break
-            else:
-                logging.warning("Server酱推送服务失败")
-                break
-        except:
-            time.sleep(1)
-            logging.warning("Server酱不起作用了，可能是你的sckey出现了问题也可能服务器波动了，正在重试......")
+    try:
+        res = FETCH_RETRY.call(
+            lambda: http_client.post(send_url, data=params).json(),
+            warning="Server酱不起作用了，可能是你的sckey出现了问题也可能服务器波动了",
+        )
+    except:
+        logging.warning("Server酱推送服务失败")
+        return False
+    if not res["errno"]:
+        logging.info("Server酱推送服务成功")
+        return True
+    logging.warning("Server酱推送服务失败")
+    return False
 
 
-def qq_mail_push(send_email, send_pwd, receive_email, check_info_list):
-    bj_time = datetime.datetime.utcnow() + datetime.timedelta(hours=8)
-    bj_time.strftime("%Y-%m-%d %H:%M:%S %p")
-    mail_msg_list = [f"""
-<h2><center> >>>>  <a href="https://github.com/ReaJason/17wanxiaoCheckin-Actions">17wanxiaoCheckin-Actions</a>
-<<<<</center></h2>
-<h2><center>期待你的Star✨</center></h2>
-<h3><center>打卡时间：{bj_time}</center></h3>
-"""
-    ]
-    for check in check_info_list:
-        if check["status"]:
-            name = check['post_dict'].get('username')
-            if not name:
-                name = check['post_dict']['name']
-            mail_msg_list.append(f"""<hr>
-<details>
-<summary style="font-family: 'Microsoft YaHei UI',serif; color: deepskyblue;">{name}：{check["type"]} 打卡结果：{check['res']}</summary>
-<pre><code>
-{json.dumps(check['check_json'], sort_keys=True, indent=4, ensure_ascii=False)}
-</code></pre>
-</details>
-<details>
-<summary style="font-family: 'Microsoft YaHei UI',serif; color: black;" >>>>填写数据抓包详情（便于代码的编写）<<<</summary>
-<pre><code>
-{json.dumps(check['post_dict']['updatainfo_detail'], sort_keys=True, indent=4, ensure_ascii=False)}
-</code></pre>
-</details>
-<details>
-<summary style="font-family: 'Microsoft YaHei UI',serif; color: lightskyblue;" >>>>打卡信息数据表格<<<</summary>
-<table id="customers">
-<tr>
-<th>Text</th>
-<th>Value</th>
-</tr>
-"""
-            )
-            for index, box in enumerate(check["post_dict"]["checkbox"]):
-                if index % 2:
-                    mail_msg_list.append(
-                        f"""<tr>
-<td>{box['description']}</td>
-<td>{box['value']}</td>
-</tr>"""
-                    )
-                else:
-                    mail_msg_list.append(f"""<tr class="alt">
-<td>{box['description']}</td>
-<td>{box['value']}</td>
-</tr>"""
-                                         )
-            mail_msg_list.append(
-                f"""
-</table></details>"""
-            )
-        else:
-            mail_msg_list.append(
-                f"""<hr>
-    <b style="color: red">{check['errmsg']}</b>"""
-            )
-    css = """<style type="text/css">
-#customers
-  {
-  font-family:"Trebuchet MS", Arial, Helvetica, sans-serif;
-  width:100%;
-  border-collapse:collapse;
-  }
-
-#customers td, #customers th 
-  {
-  font-size:1em;
-  border:1px solid #98bf21;
-  padding:3px 7px 2px 7px;
-  }
-
-#customers th 
-  {
-  font-size:1.1em;
-  text-align:left;
-  padding-top:5px;
-  padding-bottom:4px;
-  background-color:#A7C942;
-  color:#ffffff;
-  }
-
-#customers tr.alt td 
-  {
-  color:#000000;
-  background-color:#EAF2D3;
-  }
-</style>"""
-    mail_msg_list.append(css)
-    msg = MIMEText("".join(mail_msg_list), "html", "utf-8")
-    msg["From"] = send_email
-    msg["To"] = receive_email
-    msg["Subject"] = "完美校园健康打卡推送"
+def main_handler(*args, **kwargs):
+    """
+    云函数 / Actions 入口，设置环境变量 PROFILE=1 时用 cProfile + tracemalloc 运行，
+    结果写入 PROFILE_DIR（默认 profile）目录
+    """
+    if os.environ.get("PROFILE") and not profiler.enabled:
+        initLogging()
+        return profiler.profile(check_in_all, os.environ.get("PROFILE_DIR") or "profile")
+    return check_in_all()
+
+
+def check_in_all():
+    initLogging()
+    retry_budget.reset()
+    metrics.configure(os.environ.get('METRICS_DIR'))
+    breaker.reset_all()
+    # 同一容器的后续调用（热启动）复用上一次留下的连接池、登录会话、模板和密钥
+    runtime = get_runtime()
+    runtime_info = runtime.begin()
+    # 合并各分片的结果后统一推送
+    merge_dir = os.environ.get('SHARD_MERGE')
+    if merge_dir:
+        return merge_shards(merge_dir)
+    # 账号来源：ACCOUNTS 指定的 csv / jsonl / sqlite 文件，或 USERNAME / PASSWORD 环境变量
+    accounts = open_accounts()
+    # SHARD=i/N 时只打卡属于第 i 个分片的账号，结果写入 SHARD_DIR，由合并步骤推送
+    shard_arg = os.environ.get('SHARD')
+    if shard_arg:
+        shard_index, shard_total = shard.parse_shard(shard_arg)
+        accounts = shard.filter_shard(accounts, shard_index, shard_total)
+    # DAILY_STATE 指定的数据库中今天已成功的账号不再打卡，ONLY_FAILED=1 时只重跑失败的账号
+    accounts = pending_accounts(accounts, bool(os.environ.get('ONLY_FAILED')))
+    # 打卡结果逐条写入 JSONL 文件（分片时写入 SHARD_DIR，否则为 RESULTS_FILE 或临时文件），推送时再读回
+    if shard_arg:
+        shard_dir = os.environ.get('SHARD_DIR') or 'shards'
+        results_path = shard.results_path(shard_dir, shard_index, shard_total)
+    else:
+        results_path = os.environ.get('RESULTS_FILE')
+    # 推送在后台线程中进行：账号单独设置的 email / sckey 在该账号打卡完成后立即推送，汇总报告最后推送
+    from utils import notify
+    notifier = notify.Dispatcher(server_push, os.environ.get('SEND_EMAIL'), os.environ.get('SEND_PWD'))
     try:
-        with smtplib.SMTP_SSL("smtp.qq.com", 465) as server:
-            server.login(send_email, send_pwd)  # 括号中对应的是发件人邮箱账号、邮箱密码
-            server.sendmail(
-                send_email,
-                [
-                    receive_email,
-                ],
-                msg.as_string(),
-            )  # 括号中对应的是发件人邮箱账号、收件人邮箱账号、发送邮件
-            logging.info('qq邮箱推送成功')
+        with ResultSink(results_path) as sink:
+            extra_log = run_accounts(accounts, sink, notifier)
+            if extra_log is None:
+                return
+            extra_log.append(format_runtime_log(runtime_info, runtime.sessions.hits))
+            if shard_arg:
+                path = shard.write_partial(shard_dir, shard_index, shard_total, sink.count, extra_log)
+                logging.info(f"第 {shard_index}/{shard_total} 个分片打卡完成，共 {sink.count} 条结果，已写入 {path}")
+            elif not sink.count:
+                logging.info("没有需要打卡的账号，不推送")
+            else:
+                push_report(sink, extra_log, notifier=notifier)
+    finally:
+        notifier.close()
+    # 各域名当前的并发上限和请求速率，写入日志和指标，便于按部署环境调整 RATE_LIMIT_*
+    rate_limit.summary()
+    metrics.export()
 
-    except Exception as e:
-        logging.warning(f'qq邮箱推送失败：{e}')
 
+def run_accounts(accounts, sink, notifier=None):
+    """
+    逐个（或并发）打卡，结果写入 sink，并保存打卡类型和模板缓存
+    :param accounts: Account 迭代器
+    :param sink: ResultSink
+    :param notifier: notify.Dispatcher，账号设置了 email / sckey 时打卡完成后立即推送
+    :return: 额外的推送内容列表，打卡流程中断时返回 None
+    """
+    # CONCURRENCY 大于 1 时多个账号并发打卡，否则逐个打卡
+    concurrency = int(os.environ.get('CONCURRENCY') or 1)
+    if concurrency > 1:
+        check_dict_iter = check_in_concurrently(accounts, concurrency)
+    else:
+        check_dict_iter = ((i, check_in(i.phone, i.password, i.overrides())) for i in accounts)
+    for account, check_dict in check_dict_iter:
+        if not check_dict:
+            return None
+        results = [CheckResult.from_check(account.phone, check) for check in check_dict]
+        for result in results:
+            metrics.inc("check_ins", outcome=metrics.SUCCESS if result.status else metrics.FATAL)
+            sink.write(result)
+        if notifier:
+            notifier.account_done(account, results)
+    extra_log = []
+    breaker_log = format_breaker_log(breaker.summary())
+    if breaker_log:
+        extra_log.append(breaker_log)
+    stop_key_pool()
+    save_session_store()
+    get_type_store().save()
+    template_cache = get_template_cache()
+    template_cache.save()
+    if template_cache.changes:
+        extra_log.append(format_template_changes(template_cache.changes))
+        template_cache.changes.clear()
+    return extra_log
 
-def main_handler(*args, **kwargs):
-    initLogging()
-    bj_time = datetime.datetime.utcnow() + datetime.timedelta(hours=8)
-    log_info = [
-        f"""
+
+def format_runtime_log(info, session_hits=0):
+    """
+    :param info: Runtime.begin() 的返回值
+    :param session_hits: 本次调用中沿用内存中登录会话的账号数
+    :return: 推送中说明冷 / 热启动和复用情况的 markdown
+    """
+    lines = [f"#### 运行环境：{'热启动' if info['warm'] else '冷启动'}（第 {info['invocation']} 次调用）"]
+    if info['invalidated']:
+        lines.append(f"- 已清空复用的状态：{info['invalidated']}")
+    if info['warm']:
+        reused = info['reused']
+        lines.append(
+            f"- 复用：HTTP 连接池 {reused['http']} 个、登录会话 {reused['sessions']} 个"
+            f"（命中 {session_hits} 个）、打卡模板 {reused['templates']} 个、"
+            f"时间段规则 {reused['rules']} 个、RSA 密钥 {reused['rsa_keys']} 个"
+        )
+    if info['memory_mb'] is not None:
+        lines.append(f"- 内存：{info['memory_mb']:.1f}MB")
+    return "\n".join(lines)
+
+
+def merge_shards(directory):
+    """
+    读取各分片写出的结果，合并成一份报告推送
+    :param directory: 分片结果所在目录
+    """
+    run = shard.run_id()
+    partials, skipped = shard.read_partials(directory, run)
+    if skipped:
+        logging.warning(f"{directory} 中有 {skipped} 个分片不属于本次运行（{run}），已忽略")
+    if not partials:
+        logging.warning(f"{directory} 中没有本次运行（{run}）的分片结果，不推送")
+        return
+    totals = sorted({i["total"] for i in partials})
+    if len(totals) > 1:
+        # 同一次运行出现不同的分片总数，无法判断哪些结果属于今天，不推送
+        logging.error(f"本次运行（{run}）的分片总数不一致：{totals}，不推送，请清理 {directory}")
+        return
+    total = totals[0]
+    missing = sorted(set(range(1, total + 1)) - {i["shard"] for i in partials})
+    extra_log = []
+    for partial in partials:
+        extra_log.extend(partial["logs"])
+    if missing:
+        extra_log.append(f"""------
+#### 缺少分片 {', '.join(f'{i}/{total}' for i in missing)} 的打卡结果
 ------
-#### 现在时间：
-```
-{bj_time.strftime("%Y-%m-%d %H:%M:%S %p")}
-```"""]
-    raw_info = []
-    username_list = os.environ['USERNAME'].split(',')
-    password_list = os.environ['PASSWORD'].split(',')
-    sckey = os.environ['SCKEY']
+""")
+        logging.warning(f"缺少分片 {missing} 的打卡结果")
+    push_report(ResultFiles(i["results"] for i in partials), extra_log, sum(i["count"] for i in partials))
+    metrics.export()
+
+
+def push_report(results, extra_log, count=None, notifier=None):
+    """
+    生成打卡报告并通过 Server酱 和 QQ 邮箱推送，两种格式在一次遍历中生成，两个渠道并发发送
+    :param results: 可以遍历的 CheckResult 集合，例如 ResultSink
+    :param extra_log: 附加在打卡结果后面的推送内容
+    :param count: 结果条数，为空时使用 ResultSink.count 或 len(results)
+    :param notifier: notify.Dispatcher，为空时新建一个并等待发送完毕
+    """
+    sckey = os.environ.get('SCKEY')
     send_email = os.environ.get('SEND_EMAIL')
     send_pwd = os.environ.get('SEND_PWD')
     receive_email = os.environ.get('RECEIVE_EMAIL')
-    for username, password in zip([i.strip() for i in username_list if i != ''],
-                                  [i.strip() for i in password_list if i != '']):
-        check_dict = check_in(username, password)
-        raw_info.extend(check_dict)
-        if not check_dict:
-            return
-        else:
-            for check in check_dict:
-                if check["status"]:
-                    if check["post_dict"].get("checkbox"):
-                        post_msg = "\n".join(
-                            [
-                                f"| {i['description']} | {i['value']} |"
-                                for i in check["post_dict"].get("checkbox")
-                            ]
-                        )
-                    else:
-                        post_msg = "暂无详情"
-                    name = check['post_dict'].get('username')
-                    if not name:
-                        name = check['post_dict']['name']
-                    log_info.append(
-                        f"""#### {name}{check['type']}打卡信息：
-```
-{json.dumps(check['check_json'], sort_keys=True, indent=4, ensure_ascii=False)}
-```
-
-------
-| Text                           | Message |
-| :----------------------------------- | :--- |
-{post_msg}
-------
-```
-{check['res']}
-```"""
-                    )
-                    # log_info.append(
-                    #     f"""
-# ```
-# {json.dumps(check['post_dict']['updatainfo_detail'], sort_keys=True, indent=4, ensure_ascii=False)}
-# ```"""
-#                     )
-                else:
-                    log_info.append(
-                        f"""------
-#### {check['errmsg']}
-------
-"""
-                    )
-    log_info.append(
-        f"""
->
-> 
-"""
-    )
+    send_mail = bool(send_email and send_pwd and receive_email)
+    report_dir = os.environ.get('REPORT_DIR')
+    if not sckey and not send_mail and not report_dir:
+        return
+    # REPORT_SUMMARY=1 或结果超过 REPORT_SUMMARY_THRESHOLD 条（默认 100）时只推送统计和失败的结果
+    if count is None:
+        count = results.count if isinstance(results, ResultSink) else len(results)
+    summary = bool(os.environ.get('REPORT_SUMMARY')) or \
+        count > int(os.environ.get('REPORT_SUMMARY_THRESHOLD') or 100)
+    markdown = io.StringIO() if sckey else None
+    html = io.StringIO() if send_mail else None
+    # REPORT_DIR 不为空时同时把报告写入 report.md、report.html
+    files = []
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+        files = [open(os.path.join(report_dir, name), "w", encoding="utf-8") for name in ("report.md", "report.html")]
+    try:
+        report.render(
+            results, extra_log,
+            markdown=report.output(markdown, files[0] if files else None),
+            html=report.output(html, files[1] if files else None),
+            summary=summary,
+        )
+    finally:
+        for f in files:
+            f.close()
+    profiler.mark("after_render")
+    if not sckey and not send_mail:
+        return
+    own_notifier = notifier is None
+    if own_notifier:
+        from utils import notify
+        notifier = notify.Dispatcher(server_push, send_email, send_pwd)
     if sckey:
-        server_push(sckey, "\n".join(log_info))
-    if send_email and send_pwd and receive_email:
-        qq_mail_push(send_email, send_pwd, receive_email, raw_info)
+        notifier.server_chan(sckey, markdown.getvalue())
+    if send_mail:
+        notifier.mail(receive_email, html.getvalue())
+    if own_notifier:
+        notifier.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="完美校园健康打卡")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="DIR",
+                        help="开启性能分析，结果写入 DIR 目录（默认 profile）")
+    parser.add_argument("--shard", metavar="i/N",
+                        help="只打卡第 i 个分片（共 N 个）的账号，结果写入 SHARD_DIR（默认 shards）")
+    parser.add_argument("--merge", metavar="DIR",
+                        help="合并 DIR 目录中各分片的结果并推送")
+    parser.add_argument("--only-failed", action="store_true",
+                        help="只重跑今天打卡失败的账号（需要设置 DAILY_STATE）")
+    cli_args = parser.parse_args()
+    if cli_args.shard:
+        try:
+            shard.parse_shard(cli_args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        os.environ["SHARD"] = cli_args.shard
+    if cli_args.only_failed:
+        os.environ["ONLY_FAILED"] = "1"
+    if cli_args.merge:
+        os.environ["SHARD_MERGE"] = cli_args.merge
+    if cli_args.profile:
+        os.environ["PROFILE"] = "1"
+        os.environ["PROFILE_DIR"] = cli_args.profile
     main_handler()
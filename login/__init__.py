@@ -2,4 +2,20 @@
 # 创建日期：2020年09月13日09点44分
 # 作者：Zhongbr
 # 邮箱：zhongbr@icloud.com
-from .campus import CampusCard
+import importlib
+
+# 子模块按需导入：login.CampusCard、login.rsa_encrypt 第一次被访问时才加载 pycryptodome 和 requests，
+# 只用到会话存储等模块时不增加冷启动时间
+_LAZY = {'CampusCard': ('.campus', 'CampusCard')}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        module, attr = _LAZY[name]
+        value = getattr(importlib.import_module(module, __name__), attr)
+    elif name in ('campus', 'des_3', 'rsa_encrypt', 'sha1', 'session_store'):
+        value = importlib.import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
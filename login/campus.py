@@ -1,12 +1,12 @@
 import random
 import json
 import hashlib
-import requests
 import urllib3
 import logging
 
 from login import des_3
 from login import rsa_encrypt as rsa
+from utils import http_client, metrics
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -14,46 +14,55 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 class CampusCard:
     __slots__ = ['phone', 'password', 'user_info']
 
-    def __init__(self, phone, password):
+    def __init__(self, phone, password, saved_info=None, auto_login=True):
         '''
         初始化一卡通类
         :param phone: 完美校园账号
         :param password: 完美校园密码
+        :param saved_info: 之前保存的设备信息，沿用其中的 deviceId 和 RSA 密钥
+        :param auto_login: 是否在初始化时交换密钥并登录，为 False 时由调用方自行调用 exchange_secret 和 login
         '''
         self.phone = phone
         self.password = password
-        self.user_info = self.create_blank_user()
-        flag = self.exchange_secret()
-        if flag:
-            self.login()
+        self.user_info = self.create_blank_user(saved_info)
+        if auto_login:
+            flag = self.exchange_secret()
+            if flag:
+                self.login()
 
-    def create_blank_user(self):
+    def create_blank_user(self, saved_info=None):
         '''
         当传入的已登录设备信息不可用时，虚拟一个空的未登录设备
+        :param saved_info: 之前保存的设备信息，存在时沿用固定的 deviceId，避免被识别为新设备
         :return: 空设备信息
         '''
-        rsa_keys = rsa.create_key_pair(1024)
+        saved_info = saved_info or {}
+        if saved_info.get('rsaKey'):
+            rsa_keys = saved_info['rsaKey']['public'], saved_info['rsaKey']['private']
+        else:
+            rsa_keys = rsa.get_key_pool().get()
         return {
             'appKey': '',
             'sessionId': '',
             'exchangeFlag': True,
             'login': False,
             'serverPublicKey': '',
-            'deviceId': str(random.randint(999999999999999, 9999999999999999)),
+            'deviceId': saved_info.get('deviceId') or str(random.randint(999999999999999, 9999999999999999)),
             'wanxiaoVersion': 10462101,
             'rsaKey': {
-                'private': rsa_keys[1],
+                'private': rsa.load_private_key(rsa_keys[1]),
                 'public': rsa_keys[0]
             }
         }
 
+    @metrics.timed('exchange_secret', ok=bool)
     def exchange_secret(self):
         '''
         与完美校园服务器交换RSA加密的公钥，并取得sessionId
         :return:
         '''
         try:
-            resp = requests.post(
+            resp = http_client.post(
                 'https://app.17wanxiao.com/campus/cam_iface46/exchangeSecretkey.action',
                 headers={
                     'User-Agent': 'Dalvik/2.1.0 (Linux; U; Android 5.1.1; HUAWEI MLA-AL10 Build/HUAWEIMLA-AL10)',
@@ -74,6 +83,7 @@ class CampusCard:
             logging.warning(e)
             return False
 
+    @metrics.timed('login', ok=bool)
     def login(self):
         '''
         使用账号密码登录完美校园APP
@@ -81,9 +91,7 @@ class CampusCard:
         :param password: 完美校园密码
         :return:
         '''
-        password_list = []
-        for i in self.password:
-            password_list.append(des_3.des_3_encrypt(i, self.user_info['appKey'], '66666666'))
+        password_list = des_3.des_3_encrypt_many(list(self.password), self.user_info['appKey'], '66666666')
         login_args = {
             'appCode': 'M002',
             'deviceId': self.user_info['deviceId'],
@@ -105,7 +113,7 @@ class CampusCard:
             'data': des_3.object_encrypt(login_args, self.user_info['appKey'])
         }
         try:
-            resp = requests.post(
+            resp = http_client.post(
                 'https://app.17wanxiao.com/campus/cam_iface46/loginnew.action',
                 headers={'campusSign': hashlib.sha256(json.dumps(upload_args).encode('utf-8')).hexdigest()},
                 json=upload_args,
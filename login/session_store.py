@@ -0,0 +1,197 @@
+import os
+import json
+import atexit
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+# 需要持久化的登录设备信息字段
+SESSION_FIELDS = ('sessionId', 'appKey', 'deviceId', 'rsaKey')
+
+
+def _pick(user_info):
+    session = {k: user_info[k] for k in SESSION_FIELDS if k in user_info}
+    if 'rsaKey' in session:
+        # 私钥在内存中是已解析的 RSAKey，保存时只写入 base64 部分
+        session['rsaKey'] = {'public': session['rsaKey']['public'], 'private': str(session['rsaKey']['private'])}
+    session['updated'] = time.time()
+    return session
+
+
+class JsonSessionStore:
+    '''
+    以 JSON 文件保存登录设备信息，以手机号为键；
+    修改只记录在内存中，调用 save 时才写入文件，避免每次登录都重写整个文件
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            self._data = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f'读取会话文件失败：{e}')
+            self._data = {}
+
+    def get(self, phone):
+        with self._lock:
+            return self._data.get(phone)
+
+    def set(self, phone, user_info):
+        with self._lock:
+            self._data[phone] = _pick(user_info)
+            self._dirty = True
+
+    def delete(self, phone):
+        with self._lock:
+            if self._data.pop(phone, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        '''
+        有修改时写入文件
+        '''
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = f'{self.path}.tmp'
+            try:
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except OSError as e:
+                logging.warning(f'保存会话文件失败：{e}')
+
+
+class SqliteSessionStore:
+    '''
+    以 SQLite 数据库保存登录设备信息，以手机号为键
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions (phone TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL)'
+            )
+
+    def get(self, phone):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM sessions WHERE phone = ?', (phone,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, phone, user_info):
+        session = _pick(user_info)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sessions (phone, data, updated) VALUES (?, ?, ?)',
+                (phone, json.dumps(session, ensure_ascii=False), session['updated']),
+            )
+
+    def delete(self, phone):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM sessions WHERE phone = ?', (phone,))
+
+    def save(self):
+        # 每次修改都已提交
+        pass
+
+
+class MemorySessionStore:
+    '''
+    只保存在内存中的登录设备信息，云函数热启动时复用；
+    超过 ttl 秒的会话视为过期，超过 max_size 个时淘汰最久未使用的
+    '''
+
+    def __init__(self, ttl=6 * 3600, max_size=10000):
+        self.path = None
+        self.ttl = ttl
+        self.max_size = max_size
+        # 本次调用中命中的会话数，见 reset_hits
+        self.hits = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, phone):
+        with self._lock:
+            session = self._data.get(phone)
+            if session is None:
+                return None
+            if time.time() - session['updated'] > self.ttl:
+                del self._data[phone]
+                return None
+            self._data.move_to_end(phone)
+            return session
+
+    def set(self, phone, user_info):
+        with self._lock:
+            self._data[phone] = _pick(user_info)
+            self._data.move_to_end(phone)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, phone):
+        with self._lock:
+            self._data.pop(phone, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def hit(self):
+        '''
+        取出的会话校验有效后调用，计入本次调用的命中数
+        '''
+        with self._lock:
+            self.hits += 1
+
+    def save(self):
+        pass
+
+    def reset_hits(self):
+        with self._lock:
+            self.hits = 0
+
+
+def open_session_store(path):
+    '''
+    按文件后缀选择存储方式：.db/.sqlite/.sqlite3 使用 SQLite，其余使用 JSON 文件
+    :param path: 存储文件路径
+    :return: 会话存储对象
+    '''
+    if os.path.splitext(path)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteSessionStore(path)
+    return JsonSessionStore(path)
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    '''
+    获取全局会话存储，由环境变量 SESSION_STORE 指定文件路径，未设置时返回 None；
+    JSON 文件在每次运行结束（run_accounts / CampusDaemon.flush）和进程退出时写入
+    '''
+    global _session_store
+    path = os.environ.get('SESSION_STORE')
+    if not path:
+        return None
+    with _session_store_lock:
+        if _session_store is None or _session_store.path != path:
+            _session_store = open_session_store(path)
+            atexit.register(_session_store.save)
+    return _session_store
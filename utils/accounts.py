@@ -0,0 +1,116 @@
+import os
+import csv
+import json
+import sqlite3
+import logging
+from itertools import zip_longest
+
+# 账号文件支持的字段，除手机号和密码外都可以为空
+FIELDS = ('phone', 'password', 'area_str', 'temperature', 'email', 'sckey')
+
+
+class Account:
+    '''
+    单个打卡账号及其个性化设置
+    '''
+    __slots__ = FIELDS
+
+    def __init__(self, phone, password, area_str=None, temperature=None, email=None, sckey=None):
+        '''
+        :param phone: 手机号
+        :param password: 密码
+        :param area_str: 打卡地址（areaStr），为空时使用上次打卡的地址
+        :param temperature: 体温，为空时使用上次打卡的值
+        :param email: 单独接收该账号打卡结果的邮箱
+        :param sckey: 单独接收该账号打卡结果的 Server酱 sckey
+        '''
+        self.phone = str(phone).strip()
+        self.password = str(password).strip()
+        self.area_str = area_str or None
+        self.temperature = str(temperature) if temperature not in (None, '') else None
+        self.email = email or None
+        self.sckey = sckey or None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data.get(k) for k in FIELDS})
+
+    def overrides(self):
+        '''
+        :return: 需要覆盖的打卡字段，{'areaStr': ..., 'temperature': ...}
+        '''
+        overrides = {}
+        if self.area_str:
+            overrides['areaStr'] = self.area_str
+        if self.temperature:
+            overrides['temperature'] = self.temperature
+        return overrides
+
+
+def env_accounts(environ=None):
+    '''
+    从环境变量 USERNAME / PASSWORD（逗号分隔）读取账号，按位置一一对应，
+    只有一边为空的位置会被跳过并给出警告，不会让后面的账号错位
+    '''
+    environ = os.environ if environ is None else environ
+    username_list = environ.get('USERNAME', '').split(',')
+    password_list = environ.get('PASSWORD', '').split(',')
+    for index, (username, password) in enumerate(zip_longest(username_list, password_list, fillvalue='')):
+        username, password = username.strip(), password.strip()
+        if username and password:
+            yield Account(username, password)
+        elif username or password:
+            logging.warning(f'第 {index + 1} 个账号的手机号或密码为空，已跳过')
+
+
+def csv_accounts(path):
+    '''
+    CSV 文件，首行为表头：phone,password[,area_str,temperature,email,sckey]
+    '''
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            if row.get('phone') and row.get('password'):
+                yield Account.from_dict(row)
+
+
+def jsonl_accounts(path):
+    '''
+    JSON Lines 文件，每行一个 {"phone": ..., "password": ..., ...}
+    '''
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield Account.from_dict(json.loads(line))
+
+
+def sqlite_accounts(path, table='accounts'):
+    '''
+    SQLite 数据库中的 accounts 表，列名与 CSV 表头相同
+    '''
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        for row in conn.execute(f'SELECT * FROM {table}'):
+            yield Account.from_dict(dict(row))
+    finally:
+        conn.close()
+
+
+def open_accounts(source=None):
+    '''
+    按来源逐个读取账号：未指定时读取环境变量 ACCOUNTS，仍为空则使用 USERNAME / PASSWORD；
+    文件按后缀选择格式：.csv、.jsonl、.db/.sqlite/.sqlite3
+    :return: Account 迭代器
+    '''
+    source = source or os.environ.get('ACCOUNTS')
+    if not source:
+        return env_accounts()
+    suffix = os.path.splitext(source)[1].lower()
+    if suffix == '.csv':
+        return csv_accounts(source)
+    if suffix in ('.jsonl', '.ndjson'):
+        return jsonl_accounts(source)
+    if suffix in ('.db', '.sqlite', '.sqlite3'):
+        return sqlite_accounts(source)
+    raise ValueError(f'不支持的账号文件格式：{source}')
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+
+from utils.retry import FatalError
+
+# (url 中的特征片段, 熔断器名称)，按接口分别熔断
+ENDPOINTS = (
+    ('exchangeSecretkey.action', 'exchangeSecretkey.action'),
+    ('loginnew.action', 'loginnew.action'),
+    ('/sass/api/epmpics', '/sass/api/epmpics'),
+    ('/api/reported/recall', '/api/reported/recall'),
+    ('/api/reported/receive', '/api/reported/receive'),
+    ('/api/clock/school/', '/api/clock/school/*'),
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(FatalError):
+    '''
+    熔断器打开期间直接失败，不再请求上游
+    '''
+
+
+class CircuitBreaker:
+    '''
+    单个接口的熔断器：连续失败 failure_threshold 次，或请求数达到 min_requests 后错误率达到 error_rate 时打开；
+    打开 reset_timeout 秒后进入半开状态，放行一个探测请求，成功则关闭，失败则继续打开
+    '''
+
+    def __init__(self, name, failure_threshold=5, error_rate=0.5, min_requests=10, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._consecutive = 0
+        self._requests = 0
+        self._errors = 0
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        '''
+        :return: 是否允许发出请求
+        '''
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._consecutive = 0
+            if self.state == HALF_OPEN:
+                self._close()
+            else:
+                self._requests += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive += 1
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            self._requests += 1
+            self._errors += 1
+            if self._consecutive >= self.failure_threshold or (
+                    self._requests >= self.min_requests and self._errors / self._requests >= self.error_rate):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._probing = False
+
+    def _close(self):
+        self.state = CLOSED
+        self._requests = 0
+        self._errors = 0
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def endpoint_of(url):
+    '''
+    :return: url 对应的熔断器名称，不需要熔断的 url 返回 None
+    '''
+    for pattern, name in ENDPOINTS:
+        if pattern in url:
+            return name
+    return None
+
+
+def get_breaker(url):
+    '''
+    获取 url 对应接口的熔断器，阈值可通过环境变量 BREAKER_FAILURES、BREAKER_ERROR_RATE、BREAKER_RESET 调整
+    '''
+    name = endpoint_of(url)
+    if name is None:
+        return None
+    with _lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.environ.get('BREAKER_FAILURES') or 5),
+                error_rate=float(os.environ.get('BREAKER_ERROR_RATE') or 0.5),
+                reset_timeout=float(os.environ.get('BREAKER_RESET') or 60),
+            )
+    return breaker
+
+
+def reset_all():
+    with _lock:
+        _breakers.clear()
+
+
+def summary():
+    '''
+    :return: 所有熔断器的状态，[{'name', 'state', 'successes', 'failures', 'rejected', 'opened'}, ...]
+    '''
+    with _lock:
+        breakers = list(_breakers.values())
+    return [
+        {
+            'name': b.name,
+            'state': b.state,
+            'successes': b.successes,
+            'failures': b.failures,
+            'rejected': b.rejected,
+            'opened': b.opened,
+        }
+        for b in breakers
+    ]
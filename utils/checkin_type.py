@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import logging
+import threading
+
+# 第一类健康打卡（/sass/api/epmpics）
+EPMPICS = 'epmpics'
+# 第二类健康打卡（/api/reported/recall + /api/reported/receive）
+RECALL = 'recall'
+
+
+class CheckInTypeStore:
+    '''
+    记录每个学校（customerId）使用的健康打卡类型，打卡成功获取数据后自动更新
+    '''
+
+    def __init__(self, path=None, revalidate=7 * 86400):
+        '''
+        :param path: 持久化文件路径，为空时只保存在内存中
+        :param revalidate: 记录超过该秒数后重新按原流程探测一次，以防学校更换打卡系统
+        '''
+        self.path = path
+        self.revalidate = revalidate
+        self.types = {}
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, customer_id):
+        '''
+        :return: 已知且未到重新探测时间的打卡类型，否则返回 None
+        '''
+        with self._lock:
+            record = self.types.get(str(customer_id))
+        if not record or time.time() - record['checked'] > self.revalidate:
+            return None
+        return record['type']
+
+    def record(self, customer_id, check_type):
+        with self._lock:
+            old = self.types.get(str(customer_id))
+            if old and old['type'] != check_type:
+                logging.warning(f'学校 {customer_id} 的健康打卡类型由 {old["type"]} 变为 {check_type}')
+            self.types[str(customer_id)] = {'type': check_type, 'checked': time.time()}
+
+    def forget(self, customer_id):
+        '''
+        删除学校的记录，下次按原流程重新探测
+        '''
+        with self._lock:
+            self.types.pop(str(customer_id), None)
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.types = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f'读取打卡类型记录失败：{e}')
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp = f'{self.path}.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(self.types, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.warning(f'保存打卡类型记录失败：{e}')
+
+
+_type_store = None
+_type_store_lock = threading.Lock()
+
+
+def get_type_store():
+    '''
+    获取全局打卡类型记录：CHECKIN_TYPE_FILE 为持久化文件路径（默认只在内存中），
+    CHECKIN_TYPE_REVALIDATE 为重新探测间隔天数（默认 7 天）
+    '''
+    global _type_store
+    with _type_store_lock:
+        if _type_store is None:
+            _type_store = CheckInTypeStore(
+                path=os.environ.get('CHECKIN_TYPE_FILE') or None,
+                revalidate=float(os.environ.get('CHECKIN_TYPE_REVALIDATE') or 7) * 86400,
+            )
+    return _type_store
@@ -0,0 +1,90 @@
+import os
+import time
+import sqlite3
+import datetime
+import threading
+
+# 健康打卡；校内打卡使用规则的 templateid（clockSign1、clockSign2、clockSign3）
+HEALTHY = 'healthy'
+
+
+def today():
+    '''
+    :return: 北京时间的当天日期，例如 2021-01-22
+    '''
+    return (datetime.datetime.utcnow() + datetime.timedelta(hours=8)).strftime('%Y-%m-%d')
+
+
+class DailyState:
+    '''
+    以 SQLite 记录每个账号每天每种打卡的结果，重跑时跳过已成功的账号
+    '''
+
+    def __init__(self, path, keep_days=7):
+        '''
+        :param path: 数据库文件路径
+        :param keep_days: 保留最近几天的记录
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS checkins ('
+                'date TEXT NOT NULL, phone TEXT NOT NULL, type TEXT NOT NULL, '
+                'status INTEGER NOT NULL, errmsg TEXT, updated REAL, '
+                'PRIMARY KEY (date, phone, type))'
+            )
+            oldest = (datetime.datetime.utcnow() + datetime.timedelta(hours=8, days=-keep_days)).strftime('%Y-%m-%d')
+            self._conn.execute('DELETE FROM checkins WHERE date < ?', (oldest,))
+
+    def succeeded(self, phone, check_type=HEALTHY, date=None):
+        '''
+        :return: 该账号当天的这种打卡是否已经成功
+        '''
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status FROM checkins WHERE date = ? AND phone = ? AND type = ?',
+                (date or today(), phone, check_type),
+            ).fetchone()
+        return bool(row and row[0])
+
+    def failed(self, date=None):
+        '''
+        :return: 当天有打卡失败记录的手机号集合
+        '''
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT phone FROM checkins WHERE date = ? AND status = 0', (date or today(),)
+            ).fetchall()
+        return {i[0] for i in rows}
+
+    def record(self, phone, check_type, status, errmsg=None, date=None):
+        '''
+        记录一次打卡结果，同一天重复打卡时覆盖之前的结果
+        :param status: 1 成功，0 失败
+        '''
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkins (date, phone, type, status, errmsg, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (date or today(), phone, check_type, 1 if status else 0, errmsg, time.time()),
+            )
+
+
+_daily_state = None
+_daily_state_lock = threading.Lock()
+
+
+def get_daily_state():
+    '''
+    获取全局打卡状态，由环境变量 DAILY_STATE 指定数据库路径，未设置时返回 None
+    '''
+    global _daily_state
+    path = os.environ.get('DAILY_STATE')
+    if not path:
+        return None
+    with _daily_state_lock:
+        if _daily_state is None or _daily_state.path != path:
+            _daily_state = DailyState(path)
+    return _daily_state
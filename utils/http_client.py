@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from utils import breaker, metrics, rate_limit
+
+# 默认超时时间（秒），可通过环境变量 HTTP_TIMEOUT 调整
+DEFAULT_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT') or 10)
+# 每个域名连接池保持的连接数，可通过环境变量 HTTP_POOL_SIZE 调整
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE') or 10)
+# 是否保持长连接，HTTP_KEEP_ALIVE=0 时每次请求后关闭连接
+KEEP_ALIVE = os.environ.get('HTTP_KEEP_ALIVE', '1') != '0'
+
+_sessions = {}
+_lock = threading.Lock()
+# 域名重定向：{'app.17wanxiao.com': 'http://127.0.0.1:8000', ...}，用于本地模拟服务器压测，
+# 也可以通过环境变量 HTTP_HOST_OVERRIDE="域名=地址,域名=地址" 设置
+_host_overrides = dict(
+    i.split('=', 1) for i in (os.environ.get('HTTP_HOST_OVERRIDE') or '').split(',') if '=' in i
+)
+
+
+def override_hosts(mapping):
+    '''
+    将指定域名的请求转发到其他地址，传入空字典时取消所有转发
+    :param mapping: {域名: 'scheme://host:port'}
+    '''
+    _host_overrides.clear()
+    _host_overrides.update(mapping)
+
+
+def _rewrite(url):
+    parts = urlsplit(url)
+    target = _host_overrides.get(parts.netloc)
+    if target is None:
+        return url
+    target = urlsplit(target)
+    return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+
+
+def get_session(host):
+    '''
+    获取指定域名复用的 requests.Session，首次使用时创建
+    :param host: 域名（含端口）
+    :return: requests.Session
+    '''
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                # requests 第一次发请求时才导入，减少冷启动时间
+                import http.cookiejar
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # 同一个连接池被所有账号共用（热启动时还会跨调用保留），不保存任何 Set-Cookie，
+                # 避免一个账号的 cookie 随其他账号的请求发出；与直接调用 requests.post 的行为一致
+                session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                if not KEEP_ALIVE:
+                    session.headers['Connection'] = 'close'
+                _sessions[host] = session
+    return session
+
+
+def request(method, url, **kwargs):
+    '''
+    通过对应域名的连接池发送请求，未指定 timeout 时使用默认超时；
+    接口熔断时直接抛出 breaker.CircuitOpenError
+    '''
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    host = urlsplit(url).netloc
+    if _host_overrides:
+        url = _rewrite(url)
+    circuit = breaker.get_breaker(url)
+    if circuit is not None and not circuit.allow():
+        metrics.inc('http_requests', host=host, outcome='circuit_open')
+        raise breaker.CircuitOpenError(f'{circuit.name} 已熔断，跳过请求')
+    # 按原始域名限流：先等并发名额和令牌，超时、429 / 5xx 或业务限流时降低该域名的并发上限
+    limiter = rate_limit.get_limiter(host)
+    started = limiter.acquire()
+    start = time.perf_counter()
+    try:
+        resp = get_session(urlsplit(url).netloc).request(method, url, **kwargs)
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        from requests.exceptions import Timeout
+        if isinstance(e, (Timeout, TimeoutError)):
+            limiter.release(started, elapsed, rate_limit.TIMEOUT)
+        else:
+            limiter.release(started, elapsed, failed=True)
+        if circuit is not None:
+            circuit.record_failure()
+        metrics.observe('http', elapsed, metrics.FATAL, host)
+        raise
+    elapsed = time.perf_counter() - start
+    limiter.release(started, elapsed, rate_limit.throttle_reason(resp), rate_limit.retry_after(resp))
+    failed = resp.status_code >= 500
+    if circuit is not None:
+        if failed:
+            circuit.record_failure()
+        else:
+            circuit.record_success()
+    metrics.observe('http', elapsed, metrics.FATAL if failed else metrics.SUCCESS, host)
+    return resp
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def pool_count():
+    '''
+    :return: 已创建的连接池（域名）个数
+    '''
+    return len(_sessions)
+
+
+def close():
+    '''
+    关闭所有连接池
+    '''
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
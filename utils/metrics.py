@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import functools
+import threading
+
+SUCCESS = 'success'
+RETRY = 'retry'
+FATAL = 'fatal'
+
+# 未调用 configure 开启时所有记录函数直接返回，几乎没有开销
+enabled = False
+directory = None
+_timings = {}
+_counters = {}
+_gauges = {}
+_lock = threading.Lock()
+
+
+def configure(path):
+    '''
+    开启或关闭指标记录，并清空之前的数据
+    :param path: 指标导出目录，为空时关闭
+    '''
+    global enabled, directory
+    directory = path or None
+    enabled = bool(directory)
+    reset()
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def observe(phase, seconds, outcome=SUCCESS, host=''):
+    '''
+    记录一次阶段耗时
+    :param phase: 阶段名称，如 login、submit
+    :param seconds: 耗时（秒）
+    :param outcome: success / retry / fatal
+    :param host: 请求的域名
+    '''
+    if not enabled:
+        return
+    key = (phase, host, outcome)
+    with _lock:
+        stat = _timings.get(key)
+        if stat is None:
+            stat = _timings[key] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = max(stat[2], seconds)
+
+
+def inc(name, value=1, **labels):
+    '''
+    计数器加一
+    '''
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(name, value, **labels):
+    '''
+    记录当前值
+    '''
+    if not enabled:
+        return
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+class _NullTimer:
+    outcome = SUCCESS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class Timer:
+    '''
+    统计代码块耗时，出现异常时结果记为 fatal，也可以在代码块中手动设置 outcome
+    '''
+    __slots__ = ['phase', 'host', 'outcome', '_start']
+
+    def __init__(self, phase, host=''):
+        self.phase = phase
+        self.host = host
+        self.outcome = SUCCESS
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.outcome = FATAL
+        observe(self.phase, time.perf_counter() - self._start, self.outcome, self.host)
+        return False
+
+
+def timer(phase, host=''):
+    '''
+    with metrics.timer('login'): ...
+    '''
+    if not enabled:
+        return _null_timer
+    return Timer(phase, host)
+
+
+def timed(phase, ok=None, host=''):
+    '''
+    统计函数耗时的装饰器
+    :param ok: 根据返回值判断是否成功的函数，为空时只要没有异常就记为成功
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Timer(phase, host) as t:
+                result = func(*args, **kwargs)
+                if ok is not None and not ok(result):
+                    t.outcome = FATAL
+                return result
+        return wrapper
+    return decorator
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{str(v)}"' for k, v in labels) + '}'
+
+
+def snapshot():
+    '''
+    :return: 当前所有指标的字典
+    '''
+    with _lock:
+        return {
+            'timings': [
+                {'phase': phase, 'host': host, 'outcome': outcome, 'count': count, 'sum': total, 'max': peak}
+                for (phase, host, outcome), (count, total, peak) in sorted(_timings.items())
+            ],
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(_gauges.items())
+            ],
+        }
+
+
+def prometheus_text(data):
+    '''
+    转换为 Prometheus textfile collector 格式
+    '''
+    lines = [
+        '# HELP wanxiao_phase_duration_seconds Time spent in each check-in phase.',
+        '# TYPE wanxiao_phase_duration_seconds summary',
+    ]
+    for i in data['timings']:
+        labels = _labels((('phase', i['phase']), ('host', i['host']), ('outcome', i['outcome'])))
+        lines.append(f'wanxiao_phase_duration_seconds_sum{labels} {i["sum"]:.6f}')
+        lines.append(f'wanxiao_phase_duration_seconds_count{labels} {i["count"]}')
+    lines.append('# TYPE wanxiao_phase_duration_seconds_max gauge')
+    for i in data['timings']:
+        labels = _labels((('phase', i['phase']), ('host', i['host']), ('outcome', i['outcome'])))
+        lines.append(f'wanxiao_phase_duration_seconds_max{labels} {i["max"]:.6f}')
+    for kind, suffix, items in (('counter', '_total', data['counters']), ('gauge', '', data['gauges'])):
+        typed = set()
+        for i in items:
+            name = f'wanxiao_{i["name"]}{suffix}'
+            if name not in typed:
+                lines.append(f'# TYPE {name} {kind}')
+                typed.add(name)
+            lines.append(f'{name}{_labels(sorted(i["labels"].items()))} {i["value"]}')
+    lines.append('# TYPE wanxiao_last_run_timestamp_seconds gauge')
+    lines.append(f'wanxiao_last_run_timestamp_seconds {time.time():.0f}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write(path, content):
+    # 先写临时文件再改名，避免采集到写了一半的文件
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def export():
+    '''
+    将指标写入导出目录：wanxiao.prom（Prometheus textfile collector）和 wanxiao_metrics.json
+    '''
+    if not enabled:
+        return
+    data = snapshot()
+    os.makedirs(directory, exist_ok=True)
+    _write(os.path.join(directory, 'wanxiao.prom'), prometheus_text(data))
+    _write(os.path.join(directory, 'wanxiao_metrics.json'), json.dumps(data, ensure_ascii=False, indent=2))
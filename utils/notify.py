@@ -0,0 +1,250 @@
+import io
+import os
+import time
+import queue
+import logging
+import smtplib
+import threading
+from email.mime.text import MIMEText
+
+from utils import metrics, report
+
+MAIL_SUBJECT = '完美校园健康打卡推送'
+_STOP = object()
+
+
+class SmtpConnection:
+    '''
+    保持一个已登录的 SMTP 连接连续发送多封邮件，连接断开时重新连接一次
+    '''
+
+    def __init__(self, user, password, host=None, port=None, ssl=None, timeout=30):
+        '''
+        :param user: 发件邮箱
+        :param password: 邮箱授权码
+        :param host: SMTP 服务器，默认环境变量 SMTP_HOST 或 smtp.qq.com
+        :param port: 端口，默认环境变量 SMTP_PORT 或 465
+        :param ssl: 是否使用 SSL，默认环境变量 SMTP_SSL，未设置时为 True
+        '''
+        self.user = user
+        self.password = password
+        self.host = host or os.environ.get('SMTP_HOST') or 'smtp.qq.com'
+        self.port = int(port or os.environ.get('SMTP_PORT') or 465)
+        self.ssl = ssl if ssl is not None else os.environ.get('SMTP_SSL', '1') not in ('0', 'false', '')
+        self.timeout = timeout
+        self._server = None
+
+    def _connect(self):
+        if self.ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def send(self, to, html, subject=MAIL_SUBJECT):
+        '''
+        发送一封 HTML 邮件
+        :param to: 收件邮箱
+        '''
+        msg = MIMEText(html, 'html', 'utf-8')
+        msg['From'] = self.user
+        msg['To'] = to
+        msg['Subject'] = subject
+        content = msg.as_string()
+        with metrics.timer('smtp_push'):
+            for attempt in range(2):
+                try:
+                    if self._server is None:
+                        self._connect()
+                    self._server.sendmail(self.user, [to], content)
+                    return
+                except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                    # 服务器关闭了空闲连接，重新连接后再发一次
+                    self.close()
+                    if attempt:
+                        raise
+                    metrics.inc('smtp_reconnects')
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+class Channel:
+    '''
+    推送渠道，在自己的线程中按顺序发送消息，不同渠道之间并发；
+    子类只需实现 handle，每次收到上一批发送期间积压的全部消息
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f'notify-{name}', daemon=True)
+        self._thread.start()
+
+    def put(self, *message):
+        self.queue.put(message)
+
+    def handle(self, messages):
+        '''
+        发送一批消息
+        :param messages: [put 的参数元组, ...]，按放入的顺序排列
+        '''
+        raise NotImplementedError
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            messages = [i for i in batch if i is not _STOP]
+            stopped = len(messages) < len(batch)
+            try:
+                if messages:
+                    self.handle(messages)
+            except Exception as e:
+                logging.warning(f'{self.name}推送失败：{e}')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def shutdown(self):
+        pass
+
+    def stop(self):
+        '''
+        队列中已有的消息发送完后结束线程
+        '''
+        self.queue.put(_STOP)
+
+    def join(self):
+        self._thread.join()
+        self.shutdown()
+
+
+class MailChannel(Channel):
+    '''
+    邮件渠道，所有邮件共用一个 SMTP 连接
+    '''
+
+    def __init__(self, user, password):
+        self.smtp = SmtpConnection(user, password)
+        super().__init__('邮件')
+
+    def handle(self, messages):
+        for to, html in messages:
+            try:
+                self.smtp.send(to, html)
+                logging.info(f'邮件推送成功：{to}')
+            except Exception as e:
+                logging.warning(f'邮件推送失败：{to}，{e}')
+
+    def shutdown(self):
+        self.smtp.close()
+
+
+class ServerChanChannel(Channel):
+    '''
+    Server酱渠道：同一个 sckey 两次发送之间至少间隔 interval 秒，
+    等待期间同一个 sckey 的消息合并成一条发送
+    '''
+
+    def __init__(self, send, interval=None):
+        '''
+        :param send: 发送函数 send(sckey, desp)，即 index.server_push
+        :param interval: 同一个 sckey 的最小发送间隔（秒），默认环境变量 SERVERCHAN_INTERVAL 或 2
+        '''
+        self.send = send
+        self.interval = float(interval if interval is not None else os.environ.get('SERVERCHAN_INTERVAL') or 2)
+        self._last = {}
+        super().__init__('Server酱')
+
+    def handle(self, messages):
+        pending = {}
+        for sckey, desp in messages:
+            pending.setdefault(sckey, []).append(desp)
+        for sckey in sorted(pending, key=lambda i: self._last.get(i, 0)):
+            wait = self._last.get(sckey, 0) + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.send(sckey, '\n\n'.join(pending[sckey]))
+            except Exception as e:
+                logging.warning(f'Server酱推送失败：{e}')
+            self._last[sckey] = time.monotonic()
+
+
+class Dispatcher:
+    '''
+    推送分发：汇总报告发给 SCKEY / RECEIVE_EMAIL，每个账号的结果在打卡完成后立即发给账号自己的 email / sckey
+    '''
+
+    def __init__(self, server_push, send_email=None, send_pwd=None):
+        '''
+        :param server_push: Server酱发送函数 server_push(sckey, desp)
+        :param send_email: 发件邮箱，为空时不发送邮件
+        :param send_pwd: 发件邮箱授权码
+        '''
+        self._server_push = server_push
+        self.send_email = send_email
+        self.send_pwd = send_pwd
+        self._server_chan = None
+        self._mail = None
+        self._lock = threading.Lock()
+
+    def server_chan(self, sckey, desp):
+        with self._lock:
+            if self._server_chan is None:
+                self._server_chan = ServerChanChannel(self._server_push)
+        self._server_chan.put(sckey, desp)
+
+    def mail(self, to, html):
+        if not self.send_email:
+            logging.warning(f'未设置发件邮箱，无法推送到 {to}')
+            return
+        with self._lock:
+            if self._mail is None:
+                self._mail = MailChannel(self.send_email, self.send_pwd)
+        self._mail.put(to, html)
+
+    def account_done(self, account, results):
+        '''
+        一个账号打卡完成后，按账号设置的 email / sckey 推送该账号自己的结果
+        :param account: utils.accounts.Account
+        :param results: 该账号的 CheckResult 列表
+        '''
+        if not account.email and not account.sckey:
+            return
+        markdown = io.StringIO() if account.sckey else None
+        html = io.StringIO() if account.email else None
+        report.render(results, markdown=markdown, html=html)
+        if account.sckey:
+            self.server_chan(account.sckey, markdown.getvalue())
+        if account.email:
+            self.mail(account.email, html.getvalue())
+
+    def close(self):
+        '''
+        等待所有渠道发送完毕
+        '''
+        channels = [i for i in (self._server_chan, self._mail) if i is not None]
+        for channel in channels:
+            channel.stop()
+        for channel in channels:
+            channel.join()
+        self._server_chan = self._mail = None
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+# 未开启性能分析时 mark 直接返回
+enabled = False
+directory = None
+# 同一个阶段两次内存快照之间的最小间隔（秒），避免每个账号都拍快照
+SNAPSHOT_INTERVAL = float(os.environ.get('PROFILE_SNAPSHOT_INTERVAL') or 5)
+_snapshots = {}
+_lock = threading.Lock()
+# 工作线程各自的 cProfile.Profile，结束时合并到主线程的结果中
+_thread_profiles = []
+# Python 3.12 起 cProfile 基于 sys.monitoring，同时只能有一个分析器，且主线程的分析器已经记录所有线程
+PER_THREAD = sys.version_info < (3, 12)
+_local = threading.local()
+
+
+def mark(label):
+    '''
+    在阶段边界记录一次内存快照（after_login、after_template、after_submit、after_render）
+    '''
+    if not enabled:
+        return
+    import tracemalloc
+    now = time.monotonic()
+    with _lock:
+        last = _snapshots.get(label)
+        if last and now - last['time'] < SNAPSHOT_INTERVAL:
+            last['count'] += 1
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        _snapshots[label] = {
+            'time': now,
+            'count': (last['count'] if last else 0) + 1,
+            'snapshot': tracemalloc.take_snapshot(),
+            'current': current,
+            'peak': peak,
+        }
+
+
+def call(func, *args):
+    '''
+    在线程池中执行阻塞步骤时经由此函数调用：开启性能分析时用当前线程自己的 cProfile.Profile 记录 func，
+    cProfile 只记录调用 enable 的线程，否则并发打卡时主线程的结果里几乎只有等待；
+    Python 3.12 及以后主线程的分析器已覆盖所有线程，再启动一个会抛出 ValueError，直接调用
+    '''
+    if not enabled or not PER_THREAD:
+        return func(*args)
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        import cProfile
+        profiler = _local.profiler = cProfile.Profile()
+        with _lock:
+            _thread_profiles.append(profiler)
+    return profiler.runcall(func, *args)
+
+
+def write_allocations(path, top=20):
+    '''
+    写出每个阶段最后一次快照中分配内存最多的代码行
+    '''
+    import tracemalloc
+    with open(path, 'w', encoding='utf-8') as f:
+        for label, item in _snapshots.items():
+            f.write(f'===== {label}（经过 {item["count"]} 次）：当前 {item["current"] / 1024:.1f} KiB，'
+                    f'峰值 {item["peak"] / 1024:.1f} KiB =====\n')
+            snapshot = item['snapshot'].filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            for stat in snapshot.statistics('lineno')[:top]:
+                f.write(f'{stat}\n')
+            f.write('\n')
+
+
+def profile(func, path, *args, **kwargs):
+    '''
+    用 cProfile 和 tracemalloc 运行 func（线程池中经由 call 执行的步骤也会被记录），结果写入 path 目录：
+    main_handler.pstats（可用 snakeviz / pstats 查看）、main_handler.txt（按累计耗时排序）、allocations.txt
+    '''
+    # cProfile、pstats、tracemalloc 只在开启性能分析时导入
+    import pstats
+    import cProfile
+    import tracemalloc
+    global enabled, directory
+    directory = path
+    os.makedirs(path, exist_ok=True)
+    _snapshots.clear()
+    _thread_profiles.clear()
+    tracemalloc.start()
+    enabled = True
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        enabled = False
+        # 合并主线程和各工作线程（CONCURRENCY > 1 时的登录、获取模板、提交）的结果
+        with open(os.path.join(path, 'main_handler.txt'), 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(profiler, stream=f)
+            merged = 0
+            for thread_profile in _thread_profiles:
+                # 没有记录到任何调用的分析器不能合并（pstats 会抛出 TypeError）
+                thread_profile.create_stats()
+                if thread_profile.stats:
+                    stats.add(thread_profile)
+                    merged += 1
+            stats.dump_stats(os.path.join(path, 'main_handler.pstats'))
+            f.write(f'主线程和 {merged} 个工作线程的合并结果\n')
+            stats.sort_stats('cumulative').print_stats(50)
+        write_allocations(os.path.join(path, 'allocations.txt'))
+        tracemalloc.stop()
+        _snapshots.clear()
+        _thread_profiles.clear()
+        logging.info(f'性能分析结果已写入 {path}')
@@ -0,0 +1,262 @@
+import os
+import time
+import logging
+import threading
+
+from utils import metrics
+
+# 返回内容中出现这些字样时视为业务层限流（如“操作过于频繁”“系统繁忙”）
+THROTTLE_KEYWORDS = ('频繁', '繁忙', '稍后再试')
+# 视为限流的业务返回码，RATE_LIMIT_CODES="code,code" 设置
+THROTTLE_CODES = frozenset(i.strip() for i in (os.environ.get('RATE_LIMIT_CODES') or '').split(',') if i.strip())
+
+# 降低并发上限的原因
+TIMEOUT = 'timeout'
+TOO_MANY_REQUESTS = 'http_429'
+SERVER_ERROR = 'http_5xx'
+BUSINESS = 'business'
+
+
+class TokenBucket:
+    '''
+    令牌桶：平均每秒最多 rate 个请求，允许 burst 个突发；rate 为 0 时不限制
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        取一个令牌，不足时等待
+        :return: 等待的秒数
+        '''
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 先预留令牌（可以为负数），排在后面的请求等待更久，睡眠时不持有锁
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, self._paused_until - now, 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        '''
+        服务器要求稍后再试（Retry-After）时，seconds 秒内不再发放令牌
+        '''
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AimdLimiter:
+    '''
+    加性增、乘性减的并发控制：并发已用满（in_flight 达到上限 - 1）时请求成功且耗时不超过 latency_target，
+    每个上限轮次的请求把上限加一，未用满时上限不变，避免空闲时把上限“学”到与上游承受能力无关的值；
+    超时、429 / 5xx 或业务限流时上限乘以 decrease，同一轮次内的多个失败只降一次
+    '''
+
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=2.0, decrease=0.5):
+        # 上限为 0 时 acquire 会一直等待，至少为 1
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.in_flight = 0
+        self.backoffs = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        '''
+        等待一个并发名额
+        :return: 取得名额的时间，release 时传回
+        '''
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, latency, throttled=False):
+        '''
+        :param started: acquire 的返回值
+        :param latency: 请求耗时（秒）
+        :param throttled: 是否被上游限流，None 表示失败但与限流无关（不调整上限）
+        :return: 本次是否降低了上限
+        '''
+        decreased = False
+        with self._cond:
+            # 本次请求进行时是否已经用满上限
+            saturated = self.in_flight >= int(self.limit) - 1
+            self.in_flight -= 1
+            if throttled:
+                # 上一次降低之前发出的请求反映的是旧的并发，不再重复降低
+                if started >= self._last_decrease:
+                    self.limit = max(float(self.minimum), self.limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+                    self.backoffs += 1
+                    decreased = True
+            elif throttled is not None and saturated and latency <= self.latency_target:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+        return decreased
+
+
+class HostLimiter:
+    '''
+    单个域名的限流：先取并发名额，再取令牌
+    '''
+
+    def __init__(self, host, rate, burst, initial, minimum, maximum, latency_target):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AimdLimiter(initial, minimum, maximum, latency_target)
+        self.requests = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        :return: 传给 release 的凭据
+        '''
+        start = time.perf_counter()
+        started = self.concurrency.acquire()
+        self.bucket.acquire()
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.requests += 1
+            self.waited += waited
+        metrics.observe('rate_limit_wait', waited, host=self.host)
+        return started
+
+    def release(self, started, latency, reason=None, retry_after=None, failed=False):
+        '''
+        :param started: acquire 的返回值
+        :param latency: 请求耗时（秒）
+        :param reason: 限流原因（TIMEOUT / TOO_MANY_REQUESTS / SERVER_ERROR / BUSINESS），None 表示未被限流
+        :param retry_after: 服务器返回的 Retry-After 秒数
+        :param failed: 请求因与限流无关的原因失败（如连接被拒绝），不调整并发上限
+        '''
+        if retry_after:
+            self.bucket.pause(retry_after)
+        throttled = True if reason else (None if failed else False)
+        if self.concurrency.release(started, latency, throttled):
+            limit = int(self.concurrency.limit)
+            logging.info(f'{self.host} 被限流（{reason}），并发上限降至 {limit}')
+            metrics.inc('rate_limit_backoffs', host=self.host, reason=reason)
+            metrics.gauge('rate_limit_concurrency', limit, host=self.host)
+
+    def summary(self):
+        return {
+            'host': self.host,
+            'concurrency': int(self.concurrency.limit),
+            'rate': self.bucket.rate,
+            'burst': self.bucket.burst,
+            'requests': self.requests,
+            'waited': self.waited,
+            'backoffs': self.concurrency.backoffs,
+        }
+
+
+def throttle_reason(resp):
+    '''
+    根据响应判断是否被限流
+    :param resp: requests.Response
+    :return: 限流原因，未限流时返回 None
+    '''
+    if resp.status_code == 429:
+        return TOO_MANY_REQUESTS
+    if resp.status_code >= 500:
+        return SERVER_ERROR
+    content = resp.content
+    # 大多数响应不含限流字样，只做字节查找，避免再解析一次 JSON
+    if not THROTTLE_CODES and not any(i.encode('utf-8') in content for i in THROTTLE_KEYWORDS):
+        return None
+    try:
+        res = resp.json()
+    except ValueError:
+        return None
+    if not isinstance(res, dict):
+        return None
+    code = res.get('code', res.get('code_'))
+    message = str(res.get('msg') or res.get('message_') or '')
+    if str(code) in THROTTLE_CODES or any(i in message for i in THROTTLE_KEYWORDS):
+        return BUSINESS
+    return None
+
+
+def retry_after(resp):
+    '''
+    :return: Retry-After 头的秒数，没有或不是秒数时返回 None
+    '''
+    value = resp.headers.get('Retry-After')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(host):
+    '''
+    获取域名的限流器，首次使用时按环境变量创建：
+    RATE_LIMIT_RPS（每秒请求数，默认 20，0 表示不限制）、RATE_LIMIT_BURST（突发数，默认同 RPS）、
+    RATE_LIMIT_CONCURRENCY（初始并发上限，默认 4）、RATE_LIMIT_MIN / RATE_LIMIT_MAX（并发上限的范围，默认 1 / 32）、
+    RATE_LIMIT_LATENCY（耗时不超过该秒数时才增加并发，默认 2）
+    '''
+    limiter = _limiters.get(host)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(host)
+            if limiter is None:
+                rate = float(os.environ.get('RATE_LIMIT_RPS') or 20)
+                limiter = _limiters[host] = HostLimiter(
+                    host,
+                    rate=rate,
+                    burst=float(os.environ.get('RATE_LIMIT_BURST') or rate),
+                    initial=int(os.environ.get('RATE_LIMIT_CONCURRENCY') or 4),
+                    minimum=int(os.environ.get('RATE_LIMIT_MIN') or 1),
+                    maximum=int(os.environ.get('RATE_LIMIT_MAX') or 32),
+                    latency_target=float(os.environ.get('RATE_LIMIT_LATENCY') or 2),
+                )
+    return limiter
+
+
+def summary():
+    '''
+    输出各域名当前的限流参数到日志和指标
+    :return: [HostLimiter.summary(), ...]
+    '''
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    result = []
+    for limiter in limiters:
+        item = limiter.summary()
+        result.append(item)
+        metrics.gauge('rate_limit_concurrency', item['concurrency'], host=item['host'])
+        metrics.gauge('rate_limit_rps', item['rate'], host=item['host'])
+        logging.info(
+            f"{item['host']}：并发上限 {item['concurrency']}，每秒 {item['rate']:g} 个请求，"
+            f"请求 {item['requests']} 次，限流等待 {item['waited']:.2f} 秒，降低并发 {item['backoffs']} 次"
+        )
+    return result
+
+
+def reset_all():
+    '''
+    清空所有域名的限流状态
+    '''
+    with _limiters_lock:
+        _limiters.clear()
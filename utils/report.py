@@ -0,0 +1,205 @@
+import json
+import datetime
+
+# 模板在模块加载时定义一次，渲染时只做 str.format 填充
+MARKDOWN_HEADER = '''
+------
+#### 现在时间：
+```
+{time}
+```'''
+
+MARKDOWN_SUCCESS = '''
+#### {name}{type}打卡信息：
+```
+{check_json}
+```
+
+------
+| Text                           | Message |
+| :----------------------------------- | :--- |
+{rows}
+------
+```
+{res}
+```'''
+
+MARKDOWN_ROW = '| {0} | {1} |'
+
+MARKDOWN_FAILURE = '''
+------
+#### {errmsg}
+------
+'''
+
+MARKDOWN_SUMMARY = '''
+------
+#### 打卡统计：共 {total} 条，成功 {succeeded} 条，失败 {failed} 条
+------
+'''
+
+MARKDOWN_FOOTER = '''
+
+>
+>
+'''
+
+HTML_HEADER = '''
+<h2><center> >>>>  <a href="https://github.com/ReaJason/17wanxiaoCheckin-Actions">17wanxiaoCheckin-Actions</a>
+<<<<</center></h2>
+<h2><center>期待你的Star✨</center></h2>
+<h3><center>打卡时间：{time}</center></h3>
+'''
+
+HTML_SUCCESS = '''<hr>
+<details>
+<summary style="font-family: 'Microsoft YaHei UI',serif; color: deepskyblue;">{name}：{type} 打卡结果：{res}</summary>
+<pre><code>
+{check_json}
+</code></pre>
+</details>
+<details>
+<summary style="font-family: 'Microsoft YaHei UI',serif; color: black;" >>>>填写数据抓包详情（便于代码的编写）<<<</summary>
+<pre><code>
+{detail}
+</code></pre>
+</details>
+<details>
+<summary style="font-family: 'Microsoft YaHei UI',serif; color: lightskyblue;" >>>>打卡信息数据表格<<<</summary>
+<table id="customers">
+<tr>
+<th>Text</th>
+<th>Value</th>
+</tr>
+{rows}
+</table></details>'''
+
+HTML_ROW = '''<tr>
+<td>{0}</td>
+<td>{1}</td>
+</tr>'''
+
+HTML_ROW_ALT = '''<tr class="alt">
+<td>{0}</td>
+<td>{1}</td>
+</tr>'''
+
+HTML_FAILURE = '''<hr>
+    <b style="color: red">{errmsg}</b>'''
+
+HTML_SUMMARY = '''<hr>
+<h3>打卡统计：共 {total} 条，成功 {succeeded} 条，失败 {failed} 条</h3>'''
+
+HTML_FOOTER = '''<style type="text/css">
+#customers
+  {
+  font-family:"Trebuchet MS", Arial, Helvetica, sans-serif;
+  width:100%;
+  border-collapse:collapse;
+  }
+
+#customers td, #customers th
+  {
+  font-size:1em;
+  border:1px solid #98bf21;
+  padding:3px 7px 2px 7px;
+  }
+
+#customers th
+  {
+  font-size:1.1em;
+  text-align:left;
+  padding-top:5px;
+  padding-bottom:4px;
+  background-color:#A7C942;
+  color:#ffffff;
+  }
+
+#customers tr.alt td
+  {
+  color:#000000;
+  background-color:#EAF2D3;
+  }
+</style>'''
+
+
+def _dumps(data):
+    return json.dumps(data, sort_keys=True, indent=4, ensure_ascii=False)
+
+
+def render(results, extra_log=(), markdown=None, html=None, summary=False):
+    '''
+    遍历一次打卡结果，同时生成 Server酱 的 markdown 和邮件的 HTML，每条结果只序列化一次
+    :param results: CheckResult 迭代器
+    :param extra_log: 附加在 markdown 打卡结果后面的内容（接口熔断状态、模板变化等）
+    :param markdown: 写入 markdown 的对象（文件、io.StringIO、socket.makefile 等有 write 方法的对象），为空时不生成
+    :param html: 写入 HTML 的对象，为空时不生成
+    :param summary: 摘要模式，只输出失败的结果和统计数字，推送内容不随账号数增长
+    :return: (总数, 成功数)
+    '''
+    now = (datetime.datetime.utcnow() + datetime.timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S %p')
+    if markdown is not None:
+        markdown.write(MARKDOWN_HEADER.format(time=now))
+    if html is not None:
+        html.write(HTML_HEADER.format(time=now))
+    total = succeeded = 0
+    for check in results:
+        total += 1
+        if not check.status:
+            if markdown is not None:
+                markdown.write(MARKDOWN_FAILURE.format(errmsg=check.errmsg))
+            if html is not None:
+                html.write(HTML_FAILURE.format(errmsg=check.errmsg))
+            continue
+        succeeded += 1
+        if summary:
+            continue
+        check_json = _dumps(check.check_json)
+        res = str(check.res)
+        checkbox = check.checkbox or ()
+        if markdown is not None:
+            rows = '\n'.join(MARKDOWN_ROW.format(*i) for i in checkbox) if checkbox else '暂无详情'
+            markdown.write(MARKDOWN_SUCCESS.format(name=check.name, type=check.type, check_json=check_json,
+                                                   rows=rows, res=res))
+        if html is not None:
+            rows = ''.join((HTML_ROW if index % 2 else HTML_ROW_ALT).format(*i) for index, i in enumerate(checkbox))
+            html.write(HTML_SUCCESS.format(name=check.name, type=check.type, res=res, check_json=check_json,
+                                           detail=_dumps(check.detail), rows=rows))
+    if summary:
+        counts = {'total': total, 'succeeded': succeeded, 'failed': total - succeeded}
+        if markdown is not None:
+            markdown.write(MARKDOWN_SUMMARY.format(**counts))
+        if html is not None:
+            html.write(HTML_SUMMARY.format(**counts))
+    if markdown is not None:
+        for log in extra_log:
+            markdown.write('\n')
+            markdown.write(log)
+        markdown.write(MARKDOWN_FOOTER)
+    if html is not None:
+        html.write(HTML_FOOTER)
+    return total, succeeded
+
+
+class Tee:
+    '''
+    同时写入多个对象，例如推送用的 io.StringIO 和保存报告的文件
+    '''
+
+    def __init__(self, *outputs):
+        self.outputs = outputs
+
+    def write(self, text):
+        for output in self.outputs:
+            output.write(text)
+
+
+def output(*outputs):
+    '''
+    合并多个写入对象，忽略 None
+    :return: 没有对象时返回 None，只有一个时直接返回该对象，否则返回 Tee
+    '''
+    outputs = [i for i in outputs if i is not None]
+    if not outputs:
+        return None
+    return outputs[0] if len(outputs) == 1 else Tee(*outputs)
@@ -0,0 +1,130 @@
+import os
+import json
+import tempfile
+import threading
+
+
+class CheckResult:
+    '''
+    单条打卡结果，只保留推送需要的字段
+    '''
+    __slots__ = ['phone', 'status', 'type', 'name', 'res', 'check_json', 'detail', 'checkbox', 'errmsg']
+
+    def __init__(self, phone, status, type=None, name=None, res=None, check_json=None, detail=None,
+                 checkbox=None, errmsg=None):
+        '''
+        :param phone: 手机号
+        :param status: 1 打卡请求成功，0 失败
+        :param type: healthy 或校内打卡的 templateid
+        :param name: 姓名
+        :param res: 打卡接口的返回
+        :param check_json: 提交的打卡数据
+        :param detail: 打卡模板的字段详情（updatainfo_detail）
+        :param checkbox: [(描述, 填写的值), ...]
+        :param errmsg: 失败原因
+        '''
+        self.phone = phone
+        self.status = status
+        self.type = type
+        self.name = name
+        self.res = res
+        self.check_json = check_json
+        self.detail = detail
+        self.checkbox = checkbox
+        self.errmsg = errmsg
+
+    @classmethod
+    def from_check(cls, phone, check):
+        '''
+        从 healthy_check_in 等函数返回的打卡结果字典生成
+        '''
+        if not check['status']:
+            return cls(phone, 0, errmsg=check.get('errmsg'))
+        post_dict = check['post_dict']
+        return cls(
+            phone, 1, check.get('type'),
+            post_dict.get('username') or post_dict.get('name'),
+            check.get('res'), check.get('check_json'),
+            post_dict.get('updatainfo_detail'),
+            [(i['description'], i['value']) for i in post_dict.get('checkbox') or ()],
+        )
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def read_results(path):
+    '''
+    逐行读取结果文件
+    :return: CheckResult 迭代器
+    '''
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield CheckResult.from_dict(json.loads(line))
+
+
+class ResultSink:
+    '''
+    打卡结果按行写入 JSONL 文件，写完一条就落盘，推送时再逐条读回，内存占用不随账号数增长；
+    可以重复遍历
+    '''
+
+    def __init__(self, path=None):
+        '''
+        :param path: 结果文件路径，为空时使用临时文件，close 时删除
+        '''
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, 'w', encoding='utf-8')
+            self._temporary = False
+        else:
+            fd, path = tempfile.mkstemp(prefix='wanxiao-results-', suffix='.jsonl')
+            self._file = os.fdopen(fd, 'w', encoding='utf-8')
+            self._temporary = True
+        self.path = path
+        self.count = 0
+        self.succeeded = 0
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        line = json.dumps(result.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.count += 1
+            self.succeeded += 1 if result.status else 0
+
+    def __iter__(self):
+        return read_results(self.path)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ResultFiles:
+    '''
+    按顺序读取多个结果文件（例如各分片的结果），可以重复遍历
+    '''
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            yield from read_results(path)
@@ -0,0 +1,105 @@
+import os
+import time
+import random
+import logging
+import threading
+
+from utils import metrics
+
+
+class FatalError(Exception):
+    '''
+    不可重试的错误，例如密码错误、账号未注册
+    '''
+
+
+class RetryBudget:
+    '''
+    单次运行的全局重试预算，上游故障时避免所有账号都把重试次数用满
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self):
+        '''
+        消耗一次重试机会
+        :return: 预算未用完返回 True
+        '''
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def reset(self, limit=None):
+        with self._lock:
+            self.used = 0
+            if limit is not None:
+                self.limit = limit
+
+
+# 每次运行最多重试的总次数，可通过环境变量 RETRY_BUDGET 调整
+budget = RetryBudget(int(os.environ.get('RETRY_BUDGET') or 100))
+
+
+def is_retryable(exc):
+    '''
+    判断异常是否值得重试
+    '''
+    return not isinstance(exc, FatalError)
+
+
+class RetryPolicy:
+    '''
+    指数退避 + 随机抖动的重试策略
+    '''
+
+    def __init__(self, attempts=3, base_delay=1, max_delay=30, jitter=0.5, budget=budget):
+        '''
+        :param attempts: 最多尝试次数
+        :param base_delay: 第一次重试前的等待时间（秒），之后每次翻倍
+        :param max_delay: 单次等待时间上限（秒）
+        :param jitter: 随机抖动比例，等待时间在 [delay * (1 - jitter), delay] 之间
+        :param budget: 共享的重试预算
+        '''
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+
+    def delay(self, attempt):
+        '''
+        第 attempt 次失败后的等待时间（attempt 从 0 开始）
+        '''
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def call(self, func, *args, warning=None, **kwargs):
+        '''
+        调用 func，出现可重试的异常时退避后重试，重试次数或全局预算用完时抛出最后一次的异常
+        :param func: 被调用的函数
+        :param warning: 重试时输出的警告信息
+        :return: func 的返回值
+        '''
+        for attempt in range(self.attempts):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    metrics.inc('retries', outcome=metrics.FATAL)
+                    raise
+                if attempt == self.attempts - 1:
+                    metrics.inc('retries', outcome='exhausted')
+                    raise
+                if self.budget is not None and not self.budget.consume():
+                    metrics.inc('retries', outcome='budget_exhausted')
+                    logging.warning('本次运行的重试次数已用完，不再重试')
+                    raise
+                metrics.inc('retries', outcome=metrics.RETRY)
+                delay = self.delay(attempt)
+                logging.warning(f'{warning or e}，{delay:.1f} 秒后重试......')
+                time.sleep(delay)
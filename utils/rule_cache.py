@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+
+class RuleCache:
+    '''
+    校内打卡时间段规则缓存，同一学校的学生共用；
+    同一个键正在获取时，其他线程等待这次获取的结果，不会重复请求
+    '''
+
+    def __init__(self, ttl=3600):
+        '''
+        :param ttl: 缓存有效期（秒）
+        '''
+        self.ttl = ttl
+        self._rules = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        '''
+        :param key: 缓存键，例如 ('rules', customerAppTypeId)
+        :param fetch: 缓存不存在或过期时调用的获取函数，返回 None 表示获取失败（不缓存）
+        :return: 规则列表（副本），获取失败时返回 None
+        '''
+        with self._lock:
+            item = self._rules.get(key)
+            if item and time.time() - item[0] <= self.ttl:
+                return list(item[1])
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            rules = future.result()
+            return list(rules) if rules is not None else None
+        try:
+            rules = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if rules is not None:
+                self._rules[key] = (time.time(), rules)
+            del self._inflight[key]
+        future.set_result(rules)
+        return list(rules) if rules is not None else None
+
+    def __len__(self):
+        return len(self._rules)
+
+    def clear(self):
+        with self._lock:
+            self._rules.clear()
+
+
+_rule_cache = None
+_rule_cache_lock = threading.Lock()
+
+
+def get_rule_cache():
+    '''
+    获取全局规则缓存，RULE_CACHE_TTL 为有效期秒数（默认 1 小时）
+    '''
+    global _rule_cache
+    with _rule_cache_lock:
+        if _rule_cache is None:
+            _rule_cache = RuleCache(float(os.environ.get('RULE_CACHE_TTL') or 3600))
+    return _rule_cache
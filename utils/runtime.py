@@ -0,0 +1,139 @@
+import gc
+import os
+import sys
+import time
+import logging
+import threading
+
+from login.session_store import MemorySessionStore
+from utils import http_client, metrics
+from utils.rule_cache import get_rule_cache
+from utils.template_cache import get_template_cache
+
+
+def memory_mb():
+    '''
+    :return: 当前进程的常驻内存（MB），无法获取时返回 None
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss 是峰值而非当前值，Linux 上单位为 KB，macOS 上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+class Runtime:
+    '''
+    进程级运行环境：云函数容器热启动时，上一次调用留下的 HTTP 连接池、登录会话、
+    打卡模板、时间段规则和预生成的 RSA 密钥在下一次调用中直接复用；
+    内存超过上限或容器存活超过 max_age 时全部丢弃，按冷启动处理
+    '''
+
+    def __init__(self, max_memory_mb=100.0, max_age=0.0, session_ttl=6 * 3600, max_sessions=10000):
+        '''
+        :param max_memory_mb: 常驻内存上限（MB），超过时清空复用的状态，0 表示不限制
+        :param max_age: 复用状态的最长保留时间（秒），0 表示不限制
+        :param session_ttl: 内存中登录会话的有效期（秒）
+        :param max_sessions: 内存中最多保留的登录会话数
+        '''
+        self.max_memory_mb = max_memory_mb
+        self.max_age = max_age
+        self.sessions = MemorySessionStore(session_ttl, max_sessions)
+        self.invocations = 0
+        self.created = time.time()
+        self._lock = threading.Lock()
+
+    def reused(self):
+        '''
+        :return: 当前保留的可复用状态个数
+        '''
+        reused = {
+            'http': http_client.pool_count(),
+            'sessions': len(self.sessions),
+            'templates': len(get_template_cache()),
+            'rules': len(get_rule_cache()),
+            'rsa_keys': 0,
+        }
+        # 只统计已经创建的密钥池，不为此导入 Crypto
+        rsa_encrypt = sys.modules.get('login.rsa_encrypt')
+        if rsa_encrypt is not None and rsa_encrypt._key_pool is not None:
+            reused['rsa_keys'] = len(rsa_encrypt._key_pool)
+        return reused
+
+    def begin(self):
+        '''
+        每次调用开始时执行：判断冷 / 热启动，必要时清空复用的状态
+        :return: {'warm': 是否热启动, 'invocation': 第几次调用, 'age': 容器存活秒数,
+                  'memory_mb': 常驻内存, 'reused': 各类状态的复用个数, 'invalidated': 清空原因}
+        '''
+        with self._lock:
+            self.invocations += 1
+            invocation = self.invocations
+        age = time.time() - self.created
+        memory = memory_mb()
+        reason = None
+        if invocation > 1:
+            if self.max_memory_mb and memory is not None and memory > self.max_memory_mb:
+                reason = f'内存 {memory:.0f}MB 超过上限 {self.max_memory_mb:.0f}MB'
+            elif self.max_age and age > self.max_age:
+                reason = f'已运行 {age:.0f} 秒，超过 {self.max_age:.0f} 秒'
+            if reason:
+                self.invalidate(reason)
+                memory = memory_mb()
+        self.sessions.reset_hits()
+        warm = invocation > 1 and reason is None
+        reused = self.reused() if warm else dict.fromkeys(self.reused(), 0)
+        metrics.gauge('runtime_warm', int(warm))
+        if memory is not None:
+            metrics.gauge('runtime_memory_mb', round(memory, 1))
+        for kind, count in reused.items():
+            metrics.gauge('runtime_reused', count, kind=kind)
+        logging.info(f"{'热' if warm else '冷'}启动：第 {invocation} 次调用，容器已运行 {age:.0f} 秒")
+        return {
+            'warm': warm,
+            'invocation': invocation,
+            'age': age,
+            'memory_mb': memory,
+            'reused': reused,
+            'invalidated': reason,
+        }
+
+    def invalidate(self, reason=''):
+        '''
+        丢弃所有复用的状态，下一次请求重新建立连接、登录和获取模板
+        '''
+        logging.info(f'清空复用的运行状态：{reason}')
+        http_client.close()
+        self.sessions.clear()
+        get_template_cache().clear()
+        get_rule_cache().clear()
+        self.created = time.time()
+        gc.collect()
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    '''
+    获取进程级运行环境：RUNTIME_MAX_MEMORY_MB（内存上限，默认 100）、RUNTIME_MAX_AGE（最长保留秒数，默认不限制）、
+    RUNTIME_SESSION_TTL（登录会话有效期秒数，默认 6 小时）、RUNTIME_MAX_SESSIONS（最多保留的会话数，默认 10000）
+    '''
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = Runtime(
+                max_memory_mb=float(os.environ.get('RUNTIME_MAX_MEMORY_MB') or 100),
+                max_age=float(os.environ.get('RUNTIME_MAX_AGE') or 0),
+                session_ttl=float(os.environ.get('RUNTIME_SESSION_TTL') or 6 * 3600),
+                max_sessions=int(os.environ.get('RUNTIME_MAX_SESSIONS') or 10000),
+            )
+    return _runtime
@@ -0,0 +1,66 @@
+import time
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Scheduler:
+    '''
+    按时间先后执行任务的调度器（小根堆），到期的任务交给线程池执行
+    '''
+
+    def __init__(self, workers=4):
+        '''
+        :param workers: 同时执行的任务数
+        '''
+        self._heap = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(workers, 'scheduler')
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def schedule(self, when, func, *args):
+        '''
+        :param when: 执行时间（time.time() 时间戳），已过去的时间会立即执行
+        '''
+        with self._lock:
+            # seq 保证同一时间的任务按加入顺序执行，且不会比较到函数本身
+            heapq.heappush(self._heap, (when, self._seq, func, args))
+            self._seq += 1
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _run_task(self, func, args):
+        try:
+            func(*args)
+        except Exception:
+            logging.exception(f'定时任务 {getattr(func, "__name__", func)} 执行出错')
+
+    def run(self):
+        '''
+        一直运行到调用 stop，没有到期任务时休眠到下一个任务的执行时间
+        '''
+        try:
+            while not self._stopped:
+                with self._lock:
+                    now = time.time()
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        due.append(heapq.heappop(self._heap))
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._wakeup.clear()
+                for _, _, func, args in due:
+                    self._executor.submit(self._run_task, func, args)
+                if not due:
+                    self._wakeup.wait(timeout)
+        finally:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,99 @@
+import os
+import glob
+import json
+import hashlib
+
+from utils.daily_state import today
+
+
+def parse_shard(value):
+    '''
+    解析分片参数
+    :param value: "i/N"，i 从 1 开始，例如 "2/4" 表示 4 个分片中的第 2 个
+    :return: (i, N)
+    '''
+    try:
+        index, total = (int(i) for i in value.split('/'))
+    except ValueError:
+        raise ValueError(f'分片参数应为 i/N，例如 1/4：{value}')
+    if not 1 <= index <= total:
+        raise ValueError(f'分片序号应在 1 到 {total} 之间：{value}')
+    return index, total
+
+
+def shard_of(phone, total):
+    '''
+    按手机号的哈希计算所属分片，与账号列表的顺序和长度无关，新增账号不会让已有账号换分片
+    :return: 分片序号，从 1 开始
+    '''
+    digest = hashlib.sha1(str(phone).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % total + 1
+
+
+def filter_shard(accounts, index, total):
+    '''
+    只保留属于第 index 个分片的账号
+    :param accounts: Account 迭代器
+    '''
+    for account in accounts:
+        if shard_of(account.phone, total) == index:
+            yield account
+
+
+def run_id():
+    '''
+    本次分片运行的标识，写入分片信息，合并时只合并同一次运行的分片；
+    依次取环境变量 SHARD_RUN、GITHUB_RUN_ID（同一个 workflow 的各个 job 相同），都没有时为北京时间的当天日期
+    '''
+    return os.environ.get('SHARD_RUN') or os.environ.get('GITHUB_RUN_ID') or today()
+
+
+def results_path(directory, index, total):
+    '''
+    :return: 分片打卡结果（JSONL，见 utils.results.ResultSink）的路径
+    '''
+    return os.path.join(directory, f'shard-{index}-of-{total}.jsonl')
+
+
+def partial_path(directory, index, total):
+    return os.path.join(directory, f'shard-{index}-of-{total}.json')
+
+
+def write_partial(directory, index, total, count, logs):
+    '''
+    分片打卡结束后写出分片信息，打卡结果已在打卡过程中写入 results_path；
+    该文件存在表示分片已完成
+    :param count: 打卡结果条数
+    :param logs: 该分片额外的推送内容（接口熔断状态、模板变化等）
+    :return: 文件路径
+    '''
+    os.makedirs(directory, exist_ok=True)
+    path = partial_path(directory, index, total)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'shard': index, 'total': total, 'count': count, 'logs': logs, 'run': run_id()}, f,
+                  ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def read_partials(directory, run=None):
+    '''
+    按分片序号读取目录下（含子目录，方便直接合并下载的 Actions artifacts）本次运行已完成分片的信息
+    :param run: 只读取该次运行写出的分片，默认 run_id()；目录中其他运行（前一天、其他 N）留下的分片被忽略
+    :return: (分片信息列表, 忽略的文件数)，每项为 {'shard', 'total', 'count', 'logs', 'run', 'results'}，
+             results 为打卡结果文件路径
+    '''
+    run = run or run_id()
+    partials = []
+    skipped = 0
+    for path in glob.glob(os.path.join(directory, '**', 'shard-*-of-*.json'), recursive=True):
+        with open(path, encoding='utf-8') as f:
+            partial = json.load(f)
+        if partial.get('run') != run:
+            skipped += 1
+            continue
+        partial['results'] = os.path.splitext(path)[0] + '.jsonl'
+        partials.append(partial)
+    partials.sort(key=lambda i: i['shard'])
+    return partials, skipped
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# 每个账号单独保留的字段，其余模板内容同一学校共用
+USER_FIELDS = ('areaStr', 'phonenum')
+# 模板字段中每个人填写的值，按账号单独保存，不放进学校共用的模板
+VALUE_FIELD = 'value'
+
+
+def template_hash(relations):
+    '''
+    计算模板结构的哈希，只包含字段名、描述和可选值，不包含每个人填写的值
+    '''
+    schema = [
+        [i.get('propertyname'), i.get('decription'), i.get('checkValues')]
+        for i in relations
+    ]
+    return hashlib.sha1(json.dumps(schema, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TemplateCache:
+    '''
+    打卡模板缓存，以 customerid + templateid 为键保存学校共用的模板结构（字段名、描述和可选值）；
+    areaStr、phonenum 和每个字段上次填写的值按 userid 单独保存。
+    个人字段只能从该账号自己的 epmpics 响应中得到，所以只有同一个进程中同一个账号再次打卡（热启动重跑）
+    时才会命中；持久化文件只保存模板结构，用于跨运行检测模板变化，不保存任何个人信息
+    '''
+
+    def __init__(self, ttl=6 * 3600, path=None):
+        '''
+        :param ttl: 缓存有效期（秒）
+        :param path: 模板结构的持久化文件路径，为空时只缓存在内存中
+        '''
+        self.ttl = ttl
+        self.path = path
+        self.templates = {}
+        self.users = {}
+        # 本次运行中检测到的模板变化：[(customerid, templateid, 旧哈希, 新哈希), ...]
+        self.changes = []
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, customerid, templateid, userid):
+        '''
+        :return: 与 epmpics userComeApp 返回的 data 结构相同的字典，缓存不存在或过期时返回 None
+        '''
+        now = time.time()
+        with self._lock:
+            template = self.templates.get(f'{customerid}:{templateid}')
+            user = self.users.get(str(userid))
+        if not template or not user or now - template['fetched'] > self.ttl or now - user['fetched'] > self.ttl:
+            return None
+        values = user.get('values')
+        # 个人的值对应的不是当前模板（换了模板或模板字段有变化）时视为未缓存
+        if user.get('template') != f'{customerid}:{templateid}' or not isinstance(values, dict) \
+                or any(i.get('propertyname') not in values for i in template['relations']):
+            return None
+        relations = []
+        for i in template['relations']:
+            relation = dict(i)
+            relation[VALUE_FIELD] = values[i.get('propertyname')]
+            relations.append(relation)
+        data = {
+            'templateid': template['templateid'],
+            'cusTemplateRelations': relations,
+        }
+        data.update({k: user[k] for k in USER_FIELDS})
+        return data
+
+    def put(self, customerid, templateid, userid, data):
+        '''
+        保存接口返回的打卡数据，模板结构与缓存中的不同时记录变化
+        '''
+        now = time.time()
+        key = f'{customerid}:{templateid}'
+        new_hash = template_hash(data['cusTemplateRelations'])
+        with self._lock:
+            old = self.templates.get(key)
+            if old and old['hash'] != new_hash:
+                logging.warning(f'学校打卡模板发生变化：{key}，请检查打卡字段')
+                self.changes.append((customerid, templateid, old['hash'], new_hash))
+            self.templates[key] = {
+                'templateid': data['templateid'],
+                'relations': [
+                    {k: v for k, v in i.items() if k != VALUE_FIELD} for i in data['cusTemplateRelations']
+                ],
+                'hash': new_hash,
+                'fetched': now,
+            }
+            user = {k: data.get(k) for k in USER_FIELDS}
+            user['template'] = key
+            user['values'] = {i.get('propertyname'): i.get(VALUE_FIELD) for i in data['cusTemplateRelations']}
+            user['fetched'] = now
+            self.users[str(userid)] = user
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f'读取打卡模板缓存失败：{e}')
+            return
+        # 旧版本的文件中可能还有 users（个人字段），不再读取，下次保存时即被删除
+        self.templates = saved.get('templates', {})
+
+    def __len__(self):
+        return len(self.templates)
+
+    def clear(self):
+        '''
+        清空内存中的缓存（不影响持久化文件）
+        '''
+        with self._lock:
+            self.templates = {}
+            self.users = {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            saved = {'templates': self.templates}
+            tmp = f'{self.path}.tmp'
+            try:
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(saved, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.warning(f'保存打卡模板缓存失败：{e}')
+
+
+_template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cache():
+    '''
+    获取全局打卡模板缓存：TEMPLATE_CACHE 为模板结构的持久化文件路径（用于跨运行检测模板变化，默认不持久化），
+    TEMPLATE_CACHE_TTL 为有效期秒数（默认 6 小时）
+    '''
+    global _template_cache
+    with _template_cache_lock:
+        if _template_cache is None:
+            _template_cache = TemplateCache(
+                ttl=float(os.environ.get('TEMPLATE_CACHE_TTL') or 6 * 3600),
+                path=os.environ.get('TEMPLATE_CACHE') or None,
+            )
+    return _template_cache